@@ -9,6 +9,7 @@
 # See: http://creativecommons.org/licenses/by-nc-sa/4.0/deed.en
 
 from display import Displayable
+from cspProblem import Domain
 
 class Con_solver(Displayable):
     """Solves a CSP with arc consistency and domain splitting
@@ -19,12 +20,16 @@ class Con_solver(Displayable):
         * kwargs is the keyword arguments for Displayable superclass
         """
         self.csp = csp
+        self.num_checks = 0   # number of times a constraint condition is evaluated
+        self.ordering = Variable_ordering(csp)   # chooses the variable to split
+        self.splitter = Domain_splitter(csp)     # chooses how to split its domain
         super().__init__(**kwargs)    # Or Displayable.__init__(self,**kwargs)
         
-    def make_arc_consistent(self, orig_domains=None, to_do=None):
+    def make_arc_consistent(self, orig_domains=None, to_do=None, in_place=False):
         """Makes this CSP arc-consistent using generalized arc consistency
         orig_domains is the original domains
         to_do is a set of (variable,constraint) pairs
+        in_place is True to revise orig_domains itself (e.g., a Trailed_domains)
         returns the reduced domains (an arc-consistent variable:domain dictionary)
         """
         if orig_domains is None:
@@ -34,19 +39,22 @@ class Con_solver(Displayable):
                      for var in const.scope}
         else:
             to_do = to_do.copy()  # use a copy of to_do
-        domains = orig_domains.copy()
+        domains = orig_domains if in_place else orig_domains.copy()
         self.display(2,"Performing AC with domains", domains)
         while to_do:
             var, const = self.select_arc(to_do)
             self.display(3, "Processing arc (", var, ",", const, ")")
-            other_vars = [ov for ov in const.scope if ov != var]
-            new_domain = {val for val in domains[var]
-                            if self.any_holds(domains, const, {var: val}, other_vars)}
+            new_domain = self.revise(domains, var, const)
             if new_domain != domains[var]:
                 self.display(4, "Arc: (", var, ",", const, ") is inconsistent")
                 self.display(3, "Domain pruned", "dom(", var, ") =", new_domain,
                                  " due to ", const)
                 domains[var] = new_domain
+                if len(new_domain) == 0:
+                    # no solution, the remaining arcs do not matter
+                    self.ordering.conflict(const)
+                    self.display(2, "AC wiped out", var, "due to", const)
+                    return domains
                 add_to_do = self.new_to_do(var, const) - to_do
                 to_do |= add_to_do      # set union
                 self.display(3, "  adding", add_to_do if add_to_do else "nothing", "to to_do.")
@@ -54,6 +62,32 @@ class Con_solver(Displayable):
         self.display(2, "AC done. Reduced domains", domains)
         return domains
 
+    def revise(self, domains, var, const):
+        """returns the values in the domain of var that are supported by const.
+        A dedicated propagator or support table of const is used when it applies;
+        otherwise generalized arc consistency enumerates the other domains.
+        """
+        new_domain = self.propagate(domains, var, const)
+        if new_domain is not None:
+            return new_domain
+        other_vars = [ov for ov in const.scope if ov != var]
+        return restrict_domain(domains[var],
+                    lambda val: self.has_support(domains, var, const, val, other_vars))
+
+    def propagate(self, domains, var, const):
+        """returns the revised domain of var using the propagator of const,
+        or else its support table. Returns None if neither applies.
+        """
+        new_domain = const.propagate(var, domains)
+        if new_domain is None and const in self.csp.support_tables:
+            new_domain = self.csp.support_tables[const].revise(var, domains)
+        return new_domain
+
+    def has_support(self, domains, var, const, val, other_vars):
+        """is True if var=val has a support for const in domains.
+        """
+        return self.any_holds(domains, const, {var: val}, other_vars)
+
     def new_to_do(self, var, const):
         """returns new elements to be added to to_do after assigning
         variable var in constraint const.
@@ -77,6 +111,7 @@ class Con_solver(Displayable):
         Warning: this has side effects and changes the elements of env
         """
         if ind == len(other_vars):
+            self.num_checks += 1
             return const.holds(env)
         else:
             var = other_vars[ind]
@@ -101,9 +136,10 @@ class Con_solver(Displayable):
                 new_domains[var]) for var in new_domains})
             return {var: select(new_domains[var]) for var in domains}
         else:
-            var = self.select_var(x for x in self.csp.variables if len(new_domains[x]) > 1)
+            var = self.select_var((x for x in self.csp.variables if len(new_domains[x]) > 1),
+                                  new_domains)
             if var:
-                dom1, dom2 = partition_domain(new_domains[var])
+                dom1, dom2 = self.splitter.split(var, new_domains[var])
                 self.display(3, "...splitting", var, "into", dom1, "and", dom2)
                 new_doms1 = copy_with_assign(new_domains, var, dom1)                
                 new_doms2 = copy_with_assign(new_domains, var, dom2)
@@ -111,27 +147,229 @@ class Con_solver(Displayable):
                 self.display(3, " adding", to_do if to_do else "nothing", "to to_do.")
                 return self.solve_one(new_doms1, to_do) or self.solve_one(new_doms2, to_do)
 
-    def select_var(self, iter_vars):
-        """return the next variable to split"""
-        return select(iter_vars)
+    def select_var(self, iter_vars, domains=None):
+        """return the next variable to split, as chosen by the variable ordering
+        domains is the variable:domain dictionary the variables are split in
+        """
+        if domains is None:
+            domains = self.csp.domains
+        return self.ordering.select_var(iter_vars, domains)
+
+    def solve_one_trailed(self, domains=None):
+        """return a solution to the current CSP or False if there are no solutions.
+        This is solve_one on a single Trailed_domains store: domains are
+        revised in place and the changes are undone when backtracking,
+        so no dictionary is copied per node.
+        """
+        if domains is None:
+            domains = self.csp.domains
+        return self.solve_trailed(Trailed_domains(domains), None)
+
+    def solve_trailed(self, store, to_do):
+        """depth-first search with arc consistency on the trailed store.
+        The store is left as it was found, unless a solution is returned.
+        """
+        mark = store.mark()
+        self.make_arc_consistent(store, to_do, in_place=True)
+        if any(len(store[var]) == 0 for var in store):
+            store.undo(mark)
+            return False
+        elif all(len(store[var]) == 1 for var in store):
+            return {var: select(store[var]) for var in store}
+        var = self.select_var((x for x in self.csp.variables if len(store[x]) > 1), store)
+        dom1, dom2 = self.splitter.split(var, store[var])
+        self.display(3, "...splitting", var, "into", dom1, "and", dom2)
+        to_do = self.new_to_do(var, None)
+        for dom in [dom1, dom2]:
+            split_mark = store.mark()
+            store[var] = dom
+            solution = self.solve_trailed(store, to_do)
+            if solution:
+                return solution
+            store.undo(split_mark)
+        store.undo(mark)
+        return False
+
+def restrict_domain(dom, test):
+    """returns the values of domain dom for which test holds.
+    A Domain keeps its representation, any other domain gives a set.
+    """
+    if isinstance(dom, Domain):
+        return dom.filter(test)
+    return {val for val in dom if test(val)}
 
 def partition_domain(dom):
     """partitions domain dom into two.
+    A Domain splits itself, e.g., a bit domain with integer operations.
     """
+    if isinstance(dom, Domain):
+        return dom.split()
     split = len(dom) // 2
     dom1 = set(list(dom)[:split])
     dom2 = dom - dom1
     return dom1, dom2
     
+def domain_key(dom):
+    """returns a hashable value that is equal for domains with the same values.
+    A Domain gives its own key, e.g., the mask of a bit domain.
+    """
+    if isinstance(dom, Domain):
+        return dom.key()
+    return frozenset(dom)
+
 def copy_with_assign(domains, var=None, new_domain={True, False}):
     """create a copy of the domains with an assignment var=new_domain
     if var==None then it is just a copy.
+    Domain objects are immutable, so the copy shares them.
     """
     newdoms = domains.copy()
     if var is not None:
         newdoms[var] = new_domain
     return newdoms
 
+class Trailed_domains(dict):
+    """A variable:domain dictionary that logs every change on a trail,
+    so that a depth-first search can revise a single store in place
+    and undo the changes when it backtracks.
+    """
+    def __init__(self, domains):
+        super().__init__(domains)
+        self.trail = []   # (variable, previous domain) pairs
+
+    def __setitem__(self, var, dom):
+        self.trail.append((var, self[var]))
+        super().__setitem__(var, dom)
+
+    def mark(self):
+        """returns the current position of the trail"""
+        return len(self.trail)
+
+    def undo(self, mark):
+        """restores the domains to what they were at mark"""
+        while len(self.trail) > mark:
+            var, dom = self.trail.pop()
+            super().__setitem__(var, dom)
+
+from collections.abc import Mapping, MutableMapping
+
+class Persistent_domains(Mapping):
+    """An immutable variable:domain mapping that shares its structure.
+    The domains are the leaves of a tree of tuples with `width` children per
+    node, indexed by the position of the variable. Updating k domains copies
+    only the O(k log n) tree nodes on their paths, so the nodes of a search
+    frontier cost memory in proportion to what changed, not to the number of
+    variables.
+    copy() gives a Domains_overlay that records changes on top of it.
+    """
+    bits = 5
+    width = 1 << bits
+
+    def __init__(self, domains, index=None, root=None, depth=0):
+        """domains is a variable:domain dictionary, or the list of variables
+        when index, root and depth of an existing tree are given.
+        """
+        if index is None:
+            variables = list(domains)
+            index = {var: i for (i, var) in enumerate(variables)}
+            nodes = [domains[var] for var in variables]
+            while depth == 0 or len(nodes) > 1:
+                nodes = [tuple(nodes[i:i + self.width])
+                         for i in range(0, len(nodes), self.width)]
+                depth += 1
+            root = nodes[0] if nodes else ()
+            domains = variables
+        self.variables = domains
+        self.index = index
+        self.root = root
+        self.depth = depth
+
+    def __getitem__(self, var):
+        i = self.index[var]
+        node = self.root
+        for level in range(self.depth - 1, 0, -1):
+            node = node[(i >> (self.bits * level)) & (self.width - 1)]
+        return node[i & (self.width - 1)]
+
+    def __iter__(self):
+        return iter(self.variables)
+
+    def __len__(self):
+        return len(self.variables)
+
+    def __contains__(self, var):
+        return var in self.index
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def updated(self, changes):
+        """returns the mapping with the domains in the variable:domain
+        dictionary changes, sharing all the untouched tree nodes.
+        """
+        if not changes:
+            return self
+        items = [(self.index[var], dom) for (var, dom) in changes.items()]
+        root = self.update_node(self.root, self.depth - 1, items)
+        return Persistent_domains(self.variables, self.index, root, self.depth)
+
+    def update_node(self, node, level, items):
+        """returns a copy of node with the (position, domain) items set"""
+        node = list(node)
+        shift = self.bits * level
+        if level == 0:
+            for (i, dom) in items:
+                node[i & (self.width - 1)] = dom
+        else:
+            children = {}
+            for (i, dom) in items:
+                children.setdefault((i >> shift) & (self.width - 1), []).append((i, dom))
+            for (c, child_items) in children.items():
+                node[c] = self.update_node(node[c], level - 1, child_items)
+        return tuple(node)
+
+    def copy(self):
+        return Domains_overlay(self)
+
+class Domains_overlay(MutableMapping):
+    """A variable:domain mapping made of the changes to a Persistent_domains.
+    It is what make_arc_consistent and copy_with_assign work on, and
+    copying it first folds the changes into a new Persistent_domains.
+    """
+    def __init__(self, base, changes=None):
+        self.base = base
+        self.changes = changes if changes is not None else {}
+        self.folded = None   # cache of persistent()
+
+    def __getitem__(self, var):
+        if var in self.changes:
+            return self.changes[var]
+        return self.base[var]
+
+    def __setitem__(self, var, dom):
+        self.changes[var] = dom
+        self.folded = None
+
+    def __delitem__(self, var):
+        raise TypeError("variables cannot be removed from the domains")
+
+    def __iter__(self):
+        return iter(self.base)
+
+    def __len__(self):
+        return len(self.base)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def persistent(self):
+        """returns the Persistent_domains with the changes folded in"""
+        if self.folded is None:
+            self.folded = self.base.updated(self.changes)
+        return self.folded
+
+    def copy(self):
+        return Domains_overlay(self.persistent())
+
 def select(iterable):
     """select an element of iterable. Returns None if there is no such element.
 
@@ -142,22 +380,203 @@ def select(iterable):
     for e in iterable:
         return e  # returns first element found
 
-from cspExamples import test
+class Variable_ordering(object):
+    """Chooses the variable to split among the variables with more than one value.
+    This one picks the first variable given; subclasses implement heuristics.
+    """
+    def __init__(self, csp):
+        self.csp = csp
+
+    def select_var(self, iter_vars, domains):
+        """returns the variable to split among iter_vars, or None if there is none
+        domains is the current variable:domain dictionary
+        """
+        return select(iter_vars)
+
+    def conflict(self, const):
+        """called when revising with constraint const empties a domain"""
+        pass
+
+class Smallest_domain_first(Variable_ordering):
+    """Picks a variable with the fewest values (MRV),
+    breaking ties by the number of constraints on the variable.
+    """
+    def select_var(self, iter_vars, domains):
+        return min(iter_vars, default=None,
+                   key=lambda var: (len(domains[var]), -len(self.csp.var_to_const[var])))
+
+class Most_constrained_first(Variable_ordering):
+    """Picks a variable with the most constraints (degree),
+    breaking ties by the smallest domain.
+    """
+    def select_var(self, iter_vars, domains):
+        return min(iter_vars, default=None,
+                   key=lambda var: (-len(self.csp.var_to_const[var]), len(domains[var])))
+
+class Dom_wdeg(Variable_ordering):
+    """Picks a variable with the smallest ratio of domain size to weighted degree.
+    Every constraint starts with weight 1 and gains 1 each time it wipes out
+    a domain, so variables involved in failures are split early.
+    Only constraints with another unsplit variable count in the degree.
+    """
+    def __init__(self, csp):
+        super().__init__(csp)
+        self.weights = {const: 1 for const in csp.constraints}
+
+    def conflict(self, const):
+        self.weights[const] = self.weights.get(const, 1) + 1
+
+    def weighted_degree(self, var, domains):
+        return sum(self.weights.get(const, 1) for const in self.csp.var_to_const[var]
+                   if any(len(domains[ov]) > 1 for ov in const.scope if ov != var))
+
+    def select_var(self, iter_vars, domains):
+        def ratio(var):
+            wdeg = self.weighted_degree(var, domains)
+            return len(domains[var]) / wdeg if wdeg else float('inf')
+        return min(iter_vars, default=None, key=ratio)
+
+class Domain_splitter(object):
+    """Splits the domain of the variable chosen by the variable ordering.
+    The first part is searched first. This one uses partition_domain;
+    subclasses implement other strategies.
+    """
+    def __init__(self, csp):
+        self.csp = csp
+
+    def split(self, var, dom):
+        """returns the two non-empty parts of dom, the domain of var"""
+        return partition_domain(dom)
+
+class Ordered_bisection(Domain_splitter):
+    """Splits a domain into its smaller half of values and the rest.
+    A Domain keeps its values in order already; other values are sorted
+    when they can be compared.
+    """
+    def split(self, var, dom):
+        if isinstance(dom, Domain):
+            return dom.split()
+        try:
+            values = sorted(dom)
+        except TypeError:
+            values = list(dom)
+        dom1 = set(values[:len(values) // 2])
+        return dom1, set(dom) - dom1
+
+class Value_enumeration(Domain_splitter):
+    """Splits a domain into its first (smallest) value and the rest,
+    so search tries one value at a time.
+    """
+    def split(self, var, dom):
+        if isinstance(dom, Domain):
+            return dom.split_first()
+        try:
+            first = min(dom)
+        except TypeError:
+            first = select(dom)
+        return {first}, set(dom) - {first}
+
+class Residual_con_solver(Con_solver):
+    """A CSP solver that uses arc consistency with residual supports (AC-3rm).
+
+    The last support found for a value is kept as its residue, for each
+    (variable, constraint, value). A revision first checks whether the
+    residue is still in the current domains and only searches for a new
+    support when it is not. A support is stored as the residue of every
+    value in it, and residues are kept across calls to
+    make_arc_consistent, so they are reused from one search node to the next.
+    """
+    def __init__(self, csp, **kwargs):
+        super().__init__(csp, **kwargs)
+        self.residues = {}  # (var, const, val) -> supporting assignment
+        self.num_residue_hits = 0
+
+    def has_support(self, domains, var, const, val, other_vars):
+        """is True if var=val has a support for const in domains.
+        """
+        residue = self.residues.get((var, const, val))
+        if residue is not None and all(residue[ov] in domains[ov] for ov in other_vars):
+            self.num_residue_hits += 1
+            return True
+        env = {var: val}
+        if self.any_holds(domains, const, env, other_vars):
+            # any_holds leaves the support it found in env
+            for v in const.scope:
+                self.residues[(v, const, env[v])] = env
+            return True
+        return False
+
+from cspExamples import test, crossword1t, crossword1d_solutions
+from cspProblem import CSP, bit_domains
 def ac_solver(csp):
     "arc consistency (solve_one)"
     return Con_solver(csp).solve_one()
+def bit_ac_solver(csp):
+    "arc consistency with bit domains (solve_one)"
+    return Con_solver(csp).solve_one(bit_domains(csp.domains))
+def residual_ac_solver(csp):
+    "arc consistency with residual supports (solve_one)"
+    return Residual_con_solver(csp).solve_one()
+def mrv_ac_solver(csp):
+    "arc consistency with smallest domain first (solve_one)"
+    solver = Con_solver(csp)
+    solver.ordering = Smallest_domain_first(csp)
+    return solver.solve_one()
+def wdeg_ac_solver(csp):
+    "arc consistency with dom/wdeg (solve_one)"
+    solver = Con_solver(csp)
+    solver.ordering = Dom_wdeg(csp)
+    return solver.solve_one()
+def enumerate_ac_solver(csp):
+    "arc consistency with one value at a time (solve_one)"
+    solver = Con_solver(csp)
+    solver.splitter = Value_enumeration(csp)
+    return solver.solve_one()
+def trailed_ac_solver(csp):
+    "arc consistency on a trailed store (solve_one_trailed)"
+    return Con_solver(csp).solve_one_trailed()
+def table_ac_solver(csp):
+    "arc consistency with support tables (solve_one)"
+    table_csp = CSP(bit_domains(csp.domains), csp.constraints, support_tables=True)
+    return Con_solver(table_csp).solve_one()
 if __name__ == "__main__":
     test(ac_solver)
+    test(bit_ac_solver)
+    test(residual_ac_solver)
+    test(table_ac_solver)
+    test(trailed_ac_solver)
+    test(mrv_ac_solver)
+    test(wdeg_ac_solver)
+    test(enumerate_ac_solver)
+    test(ac_solver, crossword1t, crossword1d_solutions)   # table constraints
 
 from searchProblem import Arc, Search_problem
 
 class Search_with_AC_from_CSP(Search_problem,Displayable):
     """A search problem with arc consistency and domain splitting
 
-    A node is a CSP """
-    def __init__(self, csp):
-        self.cons = Con_solver(csp)  #copy of the CSP
-        self.domains = self.cons.make_arc_consistent()
+    A node is a CSP
+    solver_class is the arc consistency solver, e.g., Residual_con_solver
+    persistent is True for nodes that share their structure (see
+    Persistent_domains), so that frontier nodes only hold what changed.
+    ordering is the Variable_ordering class choosing the variable to split
+    splitter is the Domain_splitter class choosing how to split its domain
+    domains are arc consistent domains to start from, e.g., kept from an
+    earlier search; by default the domains of csp are made arc consistent
+    """
+    def __init__(self, csp, solver_class=Con_solver, persistent=False,
+                 ordering=Variable_ordering, splitter=Domain_splitter,
+                 domains=None):
+        self.cons = solver_class(csp)  #copy of the CSP
+        self.cons.ordering = ordering(csp)
+        self.cons.splitter = splitter(csp)
+        if domains is None:
+            self.domains = self.cons.make_arc_consistent()
+        else:
+            self.domains = dict(domains)
+        self.variables = list(self.domains)   # the order of fingerprints
+        if persistent:
+            self.domains = Persistent_domains(self.domains)
 
     def is_goal(self, node):
         """node is a goal if all domains have 1 element"""
@@ -166,13 +585,19 @@ class Search_with_AC_from_CSP(Search_problem,Displayable):
     def start_node(self):
         return self.domains
     
+    def fingerprint(self, node):
+        """returns a tuple of the keys of the domains of node,
+        e.g., bit masks, so nodes with the same domains are the same.
+        """
+        return tuple(domain_key(node[var]) for var in self.variables)
+
     def neighbors(self,node):
         """returns the neighboring nodes of node.
         """
         neighs = []
-        var = select(x for x in node if len(node[x])>1)
+        var = self.cons.select_var((x for x in node if len(node[x])>1), node)
         if var:
-            dom1, dom2 = partition_domain(node[var])
+            dom1, dom2 = self.cons.splitter.split(var, node[var])
             self.display(2,"Splitting", var, "into", dom1, "and", dom2)
             to_do = self.cons.new_to_do(var,None)
             for dom in [dom1,dom2]:
@@ -211,4 +636,10 @@ from cspExamples import csp1, csp2, crossword1, crossword1d
 # print(searcher3c.search())
 # searcher5c = Searcher(Search_with_AC_from_CSP(crossword1d))
 # print(searcher5c.search())
+# from cspExamples import crossword1t   # the words as table constraints
+# searcher5t = Searcher(Search_with_AC_from_CSP(crossword1t))
+# print(searcher5t.search())
+# from searchGeneric import AStarSearcherMPP   # prunes nodes with the same domains
+# searcher6c = AStarSearcherMPP(Search_with_AC_from_CSP(crossword1))
+# print(searcher6c.search())
 
@@ -8,7 +8,7 @@
 # Attribution-NonCommercial-ShareAlike 4.0 International License.
 # See: http://creativecommons.org/licenses/by-nc-sa/4.0/deed.en
 
-from cspProblem import CSP, Constraint        
+from cspProblem import CSP, Constraint, Table_constraint        
 from operator import lt,ne,eq,gt
 
 def ne_(val):
@@ -124,6 +124,19 @@ crossword1d = CSP({'p00':letters, 'p10':letters, 'p20':letters, # first row
                    Constraint(('p24', 'p34', 'p44'), is_word) # 4-across
                    ])
                
+crossword1t = CSP(crossword1d.domains,
+                  [Table_constraint(c.scope, [tuple(w) for w in words
+                                              if len(w) == len(c.scope)])
+                   for c in crossword1d.constraints])   # is_word as tables
+
+crossword1d_solutions = [
+    {'p00': 'b', 'p10': 'u', 'p20': 's', 'p01': 'u', 'p21': 'e', 'p02': 'y',
+     'p12': 'e', 'p22': 'a', 'p32': 'r', 'p03': 's', 'p23': 'r', 'p24': 'c',
+     'p34': 'a', 'p44': 'r', 'p25': 'h'},
+    {'p00': 'h', 'p10': 'a', 'p20': 's', 'p01': 'o', 'p21': 'y', 'p02': 'l',
+     'p12': 'a', 'p22': 'n', 'p32': 'e', 'p03': 'd', 'p23': 't', 'p24': 'a',
+     'p34': 'n', 'p44': 't', 'p25': 'x'}]
+
 def test(CSP_solver, csp=csp1,
              solutions=[{'A': 1, 'B': 3, 'C': 4}, {'A': 2, 'B': 3, 'C': 4}]):
     """CSP_solver is a solver that takes a csp and returns a solution
@@ -8,15 +8,20 @@
 # Attribution-NonCommercial-ShareAlike 4.0 International License.
 # See: http://creativecommons.org/licenses/by-nc-sa/4.0/deed.en
 
+from itertools import product
+
 class Constraint(object):
     """A Constraint consists of
     * scope: a tuple of variables
     * condition: a function that can applied to a tuple of values
     for the variables
+    * propagator: an optional function that revises the domain of one
+    variable of the scope faster than checking condition value by value
     """
-    def __init__(self, scope, condition):
+    def __init__(self, scope, condition, propagator=None):
         self.scope = scope
         self.condition = condition
+        self.propagator = propagator
 
     def __repr__(self):
         return self.condition.__name__ + str(self.scope)
@@ -28,16 +33,126 @@ class Constraint(object):
         """
         return self.condition(*tuple(assignment[v] for v in self.scope))
 
+    def propagate(self, var, domains):
+        """returns the values of the domain of var that have a support
+        in the other domains, or None if there is no dedicated propagator.
+
+        propagator(const, var, domains) can also return None when it does
+        not apply to the domains given, e.g., for an unexpected representation.
+        """
+        if self.propagator is None:
+            return None
+        return self.propagator(self, var, domains)
+
+class Table_constraint(Constraint):
+    """A constraint given by the tuples of values it allows.
+    * tuples: the allowed tuples of values, in the order of the scope
+    A revision uses simple tabular reduction (STR2): the tuples that are
+    still valid in the domains are kept from one revision to the next,
+    and only the variables whose domains changed since are checked.
+    A value of a variable has a support when some valid tuple has it,
+    and the scan stops checking a variable once all of its values are.
+    The valid tuples are kept as long as the domains only shrink, as
+    within one arc consistency pass or down a branch of the search;
+    other domains start again from the whole table.
+    """
+    def __init__(self, scope, tuples):
+        positions = {}
+        for i, var in enumerate(scope):
+            positions.setdefault(var, []).append(i)
+        # a variable in the scope twice has the same value in both places
+        self.tuples = [tuple(t) for t in tuples
+                       if all(len({t[i] for i in pos}) == 1
+                              for pos in positions.values())]
+        super().__init__(tuple(scope), In_table(frozenset(self.tuples)))
+        self.positions = positions
+        self.last = None   # (domains, their valid tuples, revised domains)
+
+    @classmethod
+    def from_condition(cls, scope, condition, domains):
+        """returns the table of the tuples of domains for which condition
+        holds, so condition is checked once per tuple instead of at every
+        revision; the product of the domains has to be small enough
+        """
+        return cls(scope, [t for t in product(*(domains[v] for v in scope))
+                           if condition(*t)])
+
+    def propagate(self, var, domains):
+        """returns the values of the domain of var in some valid tuple"""
+        doms = tuple(domains[v] for v in self.scope)
+        if self.last is not None and all(
+                d is last_d for d, last_d in zip(doms, self.last[0])):
+            return self.last[2][var]
+        table, changed = self.start_table(doms)
+        valid = [t for t in table if all(t[i] in doms[i] for i in changed)]
+        supported = [set() for _ in doms]
+        unsupported = set(range(len(doms)))   # the S_sup set of STR2
+        for t in valid:
+            for i in list(unsupported):
+                supported[i].add(t[i])
+                if len(supported[i]) == len(doms[i]):
+                    unsupported.discard(i)
+            if not unsupported:
+                break
+        revised = {}
+        for v, pos in self.positions.items():
+            dom = doms[pos[0]]
+            if unsupported.isdisjoint(pos):
+                revised[v] = dom
+            else:
+                keep = supported[pos[0]]
+                revised[v] = (dom.filter(lambda val: val in keep)
+                              if isinstance(dom, Domain)
+                              else {val for val in dom if val in keep})
+        self.last = (doms, valid, revised)
+        return revised[var]
+
+    def start_table(self, doms):
+        """returns the tuples to scan and the positions to check them at:
+        the valid tuples of the last revision and the positions whose
+        domains changed, if the domains only shrank since, or else
+        the whole table and every position
+        """
+        if self.last is not None:
+            last_doms = self.last[0]
+            if all(d is last_d or subset(d, last_d)
+                   for d, last_d in zip(doms, last_doms)):
+                return self.last[1], [i for i, (d, last_d) in
+                                      enumerate(zip(doms, last_doms))
+                                      if d is not last_d and d != last_d]
+        return self.tuples, range(len(doms))
+
+class In_table(object):
+    """The condition of a Table_constraint: it holds for the tuples of
+    values in allowed. Unlike a closure, it can be pickled, so the
+    constraint can be sent to other processes.
+    """
+    def __init__(self, allowed):
+        self.allowed = allowed
+        self.__name__ = "table"
+
+    def __call__(self, *values):
+        return values in self.allowed
+
+def subset(dom, other):
+    """is True if the values of domain dom are all in domain other"""
+    if isinstance(dom, Set) and isinstance(other, Set):
+        return dom <= other
+    return set(dom) <= set(other)
+
 class CSP(object):
     """A CSP consists of
     * domains, a dictionary that maps each variable to its domain
     * constraints, a list of constraints
     * variables, a set of variables
     * var_to_const, a variable to set of constraints dictionary
+    * support_tables, a constraint to Support_table dictionary
     """
-    def __init__(self,domains,constraints):
+    def __init__(self,domains,constraints,support_tables=False):
         """domains is a variable:domain dictionary
         constraints is a list of constriants
+        support_tables is True if binary constraints are to be revised
+        with compatibility tables (this needs bit domains)
         """
         self.variables = set(domains)
         self.domains = domains
@@ -46,6 +161,12 @@ class CSP(object):
         for con in constraints:
             for var in con.scope:
                 self.var_to_const[var].add(con)
+        self.use_support_tables = support_tables
+        self.support_tables = {}
+        if support_tables:
+            for con in constraints:
+                if len(set(con.scope)) == 2:
+                    self.support_tables[con] = Support_table(con, domains)
 
     def __str__(self):
         """string representation of CSP"""
@@ -55,6 +176,70 @@ class CSP(object):
         """more detailed string representation of CSP"""
         return "CSP("+str(self.domains)+", "+str([str(c) for c in self.constraints])+")"
 
+    def add_variable(self, var, domain):
+        """adds variable var with the given domain, or sets its domain"""
+        self.variables.add(var)
+        self.domains[var] = domain
+        self.var_to_const.setdefault(var, set())
+
+    def remove_variable(self, var):
+        """removes variable var and the constraints on it.
+        Returns the constraints removed.
+        """
+        removed = list(self.var_to_const[var])
+        for con in removed:
+            self.remove_constraint(con)
+        self.variables.discard(var)
+        del self.domains[var]
+        del self.var_to_const[var]
+        return removed
+
+    def add_constraint(self, con):
+        """adds constraint con on variables of the CSP"""
+        self.constraints.append(con)
+        for var in con.scope:
+            self.var_to_const[var].add(con)
+        if self.use_support_tables and len(set(con.scope)) == 2:
+            self.support_tables[con] = Support_table(con, self.domains)
+
+    def remove_constraint(self, con):
+        """removes constraint con"""
+        self.constraints.remove(con)
+        for var in con.scope:
+            self.var_to_const[var].discard(con)
+        self.support_tables.pop(con, None)
+
+    def connected(self, variables):
+        """returns the set of variables linked to some of the given
+        variables by a chain of constraints, the given ones included
+        """
+        found = set(variables)
+        to_visit = list(found)
+        while to_visit:
+            var = to_visit.pop()
+            for con in self.var_to_const[var]:
+                for other in con.scope:
+                    if other not in found:
+                        found.add(other)
+                        to_visit.append(other)
+        return found
+
+    def components(self):
+        """returns the variables split into lists that no constraint links,
+        each in the order of the domains, so that each list can be solved
+        on its own
+        """
+        component_of = {}
+        components = []
+        for var in self.domains:
+            if var not in component_of:
+                found = self.connected([var])
+                components.append([])
+                for other in found:
+                    component_of[other] = len(components) - 1
+            components[component_of[var]].append(var)
+        return components
+
     def consistent(self,assignment):
         """assignment is a variable:value dictionary
         returns True if all of the constraints that can be evaluated
@@ -64,3 +249,235 @@ class CSP(object):
                     for con in self.constraints
                     if all(v in  assignment  for v in con.scope))
 
+from collections.abc import Set
+
+class Domain(Set):
+    """Base class of the domain representations other than plain sets.
+    A domain is immutable and behaves like the set of its values.
+    filter and split give new domains of the same kind, so the solvers
+    keep working on that representation.
+    """
+    __slots__ = ()
+
+    def filter(self, test):
+        """returns the domain of the values for which test holds"""
+        raise NotImplementedError("filter")   # abstract method
+
+    def split(self):
+        """partitions the domain into two non-empty domains
+        (when it has at least two values)"""
+        raise NotImplementedError("split")   # abstract method
+
+    def key(self):
+        """returns a hashable value that is equal for domains with the same values
+        (of the same variable)"""
+        return frozenset(self)
+
+    def split_first(self):
+        """partitions the domain into its first value and the rest"""
+        first = next(iter(self))
+        return (self.filter(lambda val: val == first),
+                self.filter(lambda val: val != first))
+
+    @classmethod
+    def _from_iterable(cls, it):
+        """results of set operations with other kinds of sets are plain sets"""
+        return set(it)
+
+class BitDomain(Domain):
+    """A domain represented as a bitset over an ordered universe of values.
+    * universe is a tuple of all the values the domain may contain
+    * positions maps each value of the universe to its index
+    * mask is an integer whose i-th bit is set if universe[i] is in the domain
+    Bit domains are immutable and behave like sets of values, so they
+    can be used wherever a set domain is expected. Domains derived from
+    one another share their universe, and then emptiness checks,
+    comparisons, revision and splitting are integer operations.
+    """
+    __slots__ = ('universe', 'positions', 'mask')
+
+    def __init__(self, universe, positions, mask):
+        self.universe = universe
+        self.positions = positions
+        self.mask = mask
+
+    @classmethod
+    def from_values(cls, values):
+        """returns the bit domain containing all of values.
+        The universe is sorted when the values can be compared.
+        """
+        try:
+            universe = tuple(sorted(set(values)))
+        except TypeError:
+            universe = tuple(set(values))
+        positions = {val:i for (i,val) in enumerate(universe)}
+        return cls(universe, positions, (1 << len(universe)) - 1)
+
+    def with_mask(self, mask):
+        """returns the domain over the same universe with the given mask"""
+        return BitDomain(self.universe, self.positions, mask)
+
+    def value_at(self, i):
+        """returns the value of the i-th bit"""
+        return self.universe[i]
+
+    def index_of(self, val):
+        """returns the bit of value val, or None if val is not in the universe"""
+        return self.positions.get(val)
+
+    def same_universe(self, other):
+        """is True if other is a bit domain over the same universe"""
+        return (isinstance(other, BitDomain) and
+                type(other) is type(self) and other.universe is self.universe)
+
+    def bits(self):
+        """enumerates the indexes of the bits that are set, lowest first"""
+        mask = self.mask
+        while mask:
+            low = mask & -mask
+            yield low.bit_length() - 1
+            mask ^= low
+
+    def __iter__(self):
+        for i in self.bits():
+            yield self.value_at(i)
+
+    def __len__(self):
+        return bin(self.mask).count('1')
+
+    def __bool__(self):
+        return self.mask != 0
+
+    def __contains__(self, val):
+        i = self.index_of(val)
+        return i is not None and (self.mask >> i) & 1 == 1
+
+    def __eq__(self, other):
+        if self.same_universe(other):
+            return self.mask == other.mask
+        return Set.__eq__(self, other)
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def __le__(self, other):
+        if self.same_universe(other):
+            return self.mask & ~other.mask == 0
+        return Set.__le__(self, other)
+
+    def __and__(self, other):
+        if self.same_universe(other):
+            return self.with_mask(self.mask & other.mask)
+        return Set.__and__(self, other)
+
+    def __or__(self, other):
+        if self.same_universe(other):
+            return self.with_mask(self.mask | other.mask)
+        return Set.__or__(self, other)
+
+    def __sub__(self, other):
+        if self.same_universe(other):
+            return self.with_mask(self.mask & ~other.mask)
+        return Set.__sub__(self, other)
+
+    def filter(self, test):
+        """returns the domain of the values for which test holds"""
+        mask = 0
+        for i in self.bits():
+            if test(self.value_at(i)):
+                mask |= 1 << i
+        return self.with_mask(mask)
+
+    def split(self):
+        """partitions the domain into the lower half of its values and the rest"""
+        low = 0
+        rest = self.mask
+        for _ in range(len(self) // 2):
+            bit = rest & -rest
+            low |= bit
+            rest ^= bit
+        return self.with_mask(low), self.with_mask(rest)
+
+    def key(self):
+        return self.mask
+
+    def split_first(self):
+        """partitions the domain into its first value and the rest"""
+        first = self.mask & -self.mask
+        return self.with_mask(first), self.with_mask(self.mask ^ first)
+
+    def __repr__(self):
+        return "{" + ", ".join(repr(val) for val in self) + "}"
+
+def bit_domains(domains):
+    """returns a copy of the variable:domain dictionary domains
+    where each domain is a BitDomain
+    """
+    return {var: dom if isinstance(dom, BitDomain) else BitDomain.from_values(dom)
+            for (var, dom) in domains.items()}
+
+class Support_table(object):
+    """Compatibility tables of a binary constraint over bit domains.
+    For each variable of the scope, the table maps the bit of each value
+    in its initial domain to the mask of the compatible values in the
+    initial domain of the other variable.
+    The table of a variable is built the first time the variable is
+    revised, so constraints that are never revised cost nothing.
+    Then revising a value is a bitwise and instead of calls to the condition.
+    """
+    def __init__(self, const, domains):
+        """const is a binary constraint
+        domains is the variable:domain dictionary the tables are built over
+        """
+        self.const = const
+        self.domains = domains
+        self.tables = {}   # var -> {bit: mask of supports}
+
+    def other(self, var):
+        """returns the other variable of the scope"""
+        x, y = self.const.scope
+        return y if var == x else x
+
+    def table(self, var):
+        """returns the table of var, building it if needed"""
+        if var not in self.tables:
+            dom, other_dom = self.domains[var], self.domains[self.other(var)]
+            first = var == self.const.scope[0]
+            table = {}
+            for i in dom.bits():
+                val = dom.value_at(i)
+                mask = 0
+                for j in other_dom.bits():
+                    other_val = other_dom.value_at(j)
+                    if (self.const.condition(val, other_val) if first
+                            else self.const.condition(other_val, val)):
+                        mask |= 1 << j
+                table[i] = mask
+            self.tables[var] = table
+        return self.tables[var]
+
+    def covers(self, var, dom):
+        """is True if dom is a subset of the initial domain of var,
+        so the table of var applies to it"""
+        initial = self.domains[var]
+        return (isinstance(dom, BitDomain) and isinstance(initial, BitDomain)
+                and dom.same_universe(initial) and dom.mask & ~initial.mask == 0)
+
+    def revise(self, var, domains):
+        """returns the values in the domain of var that have a compatible value
+        in the domain of the other variable, or None if the tables do not apply
+        """
+        other = self.other(var)
+        dom, other_dom = domains[var], domains[other]
+        if not (self.covers(var, dom) and self.covers(other, other_dom)):
+            return None
+        table = self.table(var)
+        other_mask = other_dom.mask
+        mask = 0
+        for i in dom.bits():
+            if table[i] & other_mask:
+                mask |= 1 << i
+        return dom.with_mask(mask)
@@ -1,49 +1,159 @@
-import sys
+import argparse
+import glob
+import io
+import os
+import random
 import re
-from cspProblem import Constraint, CSP
-from cspConsistency import Search_with_AC_from_CSP
-from searchGeneric import AStarSearcher
-from itertools import accumulate
+import sys
+import time
+from cspProblem import Constraint, CSP, Domain, BitDomain, Table_constraint
+from cspConsistency import Search_with_AC_from_CSP, select
+from cspConsistency import Variable_ordering, Smallest_domain_first
+from cspConsistency import Most_constrained_first, Dom_wdeg
+from cspConsistency import Ordered_bisection, Value_enumeration
+from cspConsistency import restrict_domain, domain_key, Con_solver
+from searchGeneric import AStarSearcher, AStarSearcherMPP, DF_branch_and_bound
+from searchGeneric import IDAStarSearcher, SMAStarSearcher
+from searchGeneric import Anytime_branch_and_bound, Searcher
+from searchGeneric import Parallel_branch_and_bound
+from functools import lru_cache
+from itertools import product
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import queue
 
 
 '''
-due to numbers' comparable nature, the
-domains are presented in a 3-digit number
-where the hundreds place shows the weekday
-the tens place and ones place shows the time
+time slots are numbered by contiguous integers in
+chronological order, from the first hour of the first
+day to the last hour of the last day of the horizon
+
+a task of some duration starting at slot s ends at
+slot s + duration, as long as it stays in the same day
 
-the following four dictionaries are dedicated for
-conversion from string to value and vice versa
+the calendar keeps the conversion tables from
+string to slot and vice versa, and the hour offset
+of every slot used by the cost calculation
 '''
-# for look up value for some weekday
-week_dict = dict(zip(
-    ['mon', 'tue', 'wed', 'thu', 'fri'],
-    [i * 100 for i in range(1, 6)]
-))
+weekdays = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
+
+
+# name of some hour of the day, e.g. 9am, 12pm, 5pm
+def hour_name(hour: int):
+    if hour == 0:
+        return '12am'
+    elif hour < 12:
+        return '{}am'.format(hour)
+    elif hour == 12:
+        return '12pm'
+    else:
+        return '{}pm'.format(hour - 12)
+
+
+# for look up some hour of the day by its name
+hour_name_dict = {hour_name(h): h for h in range(24)}
+
+
+# a day, hour or time slot name, such as wed, tue2, 8am or mon 9am,
+# whether or not it is in a given calendar
+def is_time_name(name: str):
+    return all(w in hour_name_dict
+               or re.fullmatch('({})[0-9]*'.format('|'.join(weekdays)), w)
+               for w in name.split(' '))
+
+
+# working days and hours over a horizon of some weeks
+# days of the first week are named mon, tue, ...
+# and days of the k-th week are named mon<k>, tue<k>, ...
+class Calendar(object):
+    def __init__(self, days=('mon', 'tue', 'wed', 'thu', 'fri'),
+                 first_hour: int = 9, last_hour: int = 17, weeks: int = 1):
+        assert all(d in weekdays for d in days), days
+        assert 0 <= first_hour < last_hour <= 23
+        assert weeks >= 1
+        self.days = tuple(sorted(days, key=weekdays.index))
+        self.first_hour = first_hour
+        self.last_hour = last_hour
+        self.weeks = weeks
+
+        # for look up value for some weekday and daytime
+        self.week_dict = {}
+        for w in range(weeks):
+            for d in self.days:
+                name = d if w == 0 else '{}{}'.format(d, w + 1)
+                self.week_dict[name] = len(self.week_dict)
+        self.time_dict = {hour_name(h): h
+                          for h in range(first_hour, last_hour + 1)}
+
+        # precomputed tables indexed by slot
+        self.slot_names = []
+        self.day_of = []
+        self.hour_of = []
+        self.hours = []
+        self.day_masks = [0] * len(self.week_dict)
+        for name, day in self.week_dict.items():
+            week, weekday = divmod(day, len(self.days))
+            weekday = weekdays.index(self.days[weekday])
+            for t, h in self.time_dict.items():
+                self.slot_names.append(name + ' ' + t)
+                self.day_of.append(day)
+                self.hour_of.append(h)
+                self.hours.append((week * 7 + weekday) * 24 + h)
+                self.day_masks[day] |= 1 << (len(self.slot_names) - 1)
+        self.size = len(self.slot_names)
+
+        # all the working time slot
+        self.timeslot_mapping = dict(enumerate(self.slot_names))
+        self.reversed_timeslot = {n: s for s, n in enumerate(self.slot_names)}
+
+    def __repr__(self):
+        return 'Calendar({}, {}-{}, {} weeks)'.format(
+            ','.join(self.days), hour_name(self.first_hour),
+            hour_name(self.last_hour), self.weeks)
+
+    # look up a day, hour or time slot name in one of the tables above
+    # a name outside the calendar must not be ignored silently
+    def lookup(self, table: dict, name: str):
+        if name not in table:
+            raise ValueError('{} is outside {}'.format(name, self))
+        return table[name]
+
+    # convert time from slot to hours
+    # its useful when it comes to the cost calculation
+    def convert_to_hours(self, t: int):
+        return self.hours[t]
 
+    # a task starting at slot t can last duration hours
+    def fits(self, t: int, duration: int):
+        return self.hour_of[t] + duration <= self.last_hour
 
-# for look up value for some daytime
-time_dict = dict(zip(
-    ['{}am'.format(i) if (i < 12) else '12pm'
-     if (i == 12) else '{}pm'.format(i - 12)
-        for i in range(9, 18)],
-    [i for i in range(9, 18)]
-))
+    # t1 and t2 are scheduled on the same day
+    def same_day(self, t1: tuple, t2: tuple):
+        return self.day_of[t1[0]] == self.day_of[t2[0]]
 
+    # mask of all the slots of the days touched by mask
+    def days_mask(self, mask: int):
+        result = 0
+        for day_mask in self.day_masks:
+            if mask & day_mask:
+                result |= day_mask
+        return result
 
-# all the working time slot
-timeslot_mapping = dict([(week_dict[d] + time_dict[t], d + ' ' + t)
-                         for t in time_dict.keys()
-                         for d in week_dict.keys()])
-reversed_timeslot = dict([(d + ' ' + t, week_dict[d] + time_dict[t])
-                          for t in time_dict.keys()
-                          for d in week_dict.keys()])
+    # propagator of same_day, see propagate_before
+    # a start is kept if the other task can start on that day
+    def propagate_same_day(self, const, var, domains: dict):
+        x, y = slot_domains(const, domains)
+        if x is None:
+            return None
+        other = y if var == const.scope[0] else x
+        return domains[var].with_mask(
+            domains[var].mask & self.days_mask(other.mask))
 
 
-# convert time from 3-digit number to hours
-# its useful when it comes to the cost calculation
-def convert_to_hours(t):
-    return t % 100 + (t - 100) // 100 * 24
+# mon to fri, 9am to 5pm, one week
+default_calendar = Calendar()
 
 
 ''' 
@@ -52,6 +162,8 @@ constraints verification functions
 each varify function require two tuples
 the 0 position stands for the starting time
 and 1 position stands for the ending time
+
+same_day depends on the calendar, see Calendar.same_day
 '''
 
 
@@ -65,23 +177,293 @@ def after(t1: tuple, t2: tuple):
     return t1[0] >= t2[1]
 
 
-# t1 and t2 are scheduled on the same day
-def same_day(t1: tuple, t2: tuple):
-    return t1[0] // 100 == t2[0] // 100
-
-
 # t1 starts exactly when t2 ends
 def start_at(t1: tuple, t2: tuple):
     return t2[1] == t1[0]
 
 
+'''
+bounds propagators
+
+before, after and start_at are monotone in the start
+times, so a start of one task has a support if and only
+if it is compatible with the earliest or the latest start
+of the other task. the domains are revised with a few
+integer operations on their masks, which gives the same
+result as checking the constraint for every pair of values
+
+each propagator takes the constraint, the variable to
+revise and the domains, and returns the revised domain
+of the variable, or None to fall back to the generic
+arc consistency when the domains are not slot domains
+'''
+
+
+# the two slot domains of a binary constraint, or None
+def slot_domains(const, domains: dict):
+    x, y = (domains[v] for v in const.scope)
+    if (isinstance(x, SlotDomain) and isinstance(y, SlotDomain)
+            and const.scope[0] != const.scope[1]):
+        return x, y
+    return None, None
+
+
+# index of the lowest and the highest set bit
+def lowest_bit(mask: int):
+    return (mask & -mask).bit_length() - 1
+
+
+def highest_bit(mask: int):
+    return mask.bit_length() - 1
+
+
+# keep the bits from first onwards
+def mask_from(mask: int, first: int):
+    return mask if first <= 0 else mask >> first << first
+
+
+# keep the bits up to last
+def mask_upto(mask: int, last: int):
+    return 0 if last < 0 else mask & ((1 << (last + 1)) - 1)
+
+
+# t1 must end by the latest start of t2,
+# t2 must start after the earliest end of t1
+def propagate_before(const, var, domains: dict):
+    x, y = slot_domains(const, domains)
+    if x is None:
+        return None
+    if not x or not y:
+        return domains[var].with_mask(0)
+    if var == const.scope[0]:
+        return x.with_mask(
+            mask_upto(x.mask, highest_bit(y.mask) - x.duration))
+    return y.with_mask(mask_from(y.mask, lowest_bit(x.mask) + x.duration))
+
+
+# t1 must start after the earliest end of t2,
+# t2 must end by the latest start of t1
+def propagate_after(const, var, domains: dict):
+    x, y = slot_domains(const, domains)
+    if x is None:
+        return None
+    if not x or not y:
+        return domains[var].with_mask(0)
+    if var == const.scope[0]:
+        return x.with_mask(mask_from(x.mask, lowest_bit(y.mask) + y.duration))
+    return y.with_mask(mask_upto(y.mask, highest_bit(x.mask) - y.duration))
+
+
+# t1 starts exactly at t2 + duration of t2,
+# so the masks are matched by a shift
+def propagate_start_at(const, var, domains: dict):
+    x, y = slot_domains(const, domains)
+    if x is None:
+        return None
+    if var == const.scope[0]:
+        return x.with_mask(x.mask & (y.mask << y.duration))
+    return y.with_mask(y.mask & (x.mask >> y.duration))
+
+
+'''
+disjunctive resources
+
+tasks that share one person or one machine cannot overlap. a single
+n-ary constraint over them is revised by timetabling, which keeps the
+starts of each task clear of the slots that another task covers
+whatever its start, and by edge finding, which moves a task after
+(or before) a set of tasks when it cannot end before (or start
+after) all of them. both are repeated until the domains settle
+'''
+
+
+# tasks on one resource do not overlap: in start order, each ends
+# by the next start; tasks of no duration take no time of it
+def no_overlap(*values):
+    ordered = sorted(v for v in values if v[1] > v[0])
+    return all(v1[1] <= v2[0] for v1, v2 in zip(ordered, ordered[1:]))
+
+
+no_overlap_bottom = float('-inf')
+
+
+# earliest completion times of sets of tasks on one resource, see
+# Vilim, "O(n log n) filtering algorithms for unary resource constraints"
+# the leaves are the tasks in order of earliest start; a task is in
+# theta, in the gray set lambda, or removed, and each node keeps for
+# the tasks below it the total duration and earliest completion of
+# theta, the same with at most one gray task added, and the gray
+# tasks responsible for those
+class Theta_lambda_tree:
+    def __init__(self, est: list, durations: list):
+        self.est, self.durations = est, durations
+        self.size = 1
+        while self.size < len(est):
+            self.size *= 2
+        self.leaf = {}
+        for position, i in enumerate(sorted(range(len(est)),
+                                            key=lambda i: est[i])):
+            self.leaf[i] = self.size + position
+        nodes = 2 * self.size
+        self.sum = [0] * nodes
+        self.ect = [no_overlap_bottom] * nodes
+        self.gray_sum = [0] * nodes
+        self.gray_ect = [no_overlap_bottom] * nodes
+        self.sum_by = [None] * nodes     # gray task of gray_sum
+        self.ect_by = [None] * nodes     # gray task of gray_ect
+        for i, node in self.leaf.items():
+            self.sum[node] = self.gray_sum[node] = durations[i]
+            self.ect[node] = self.gray_ect[node] = est[i] + durations[i]
+        for node in range(self.size - 1, 0, -1):
+            self.combine(node)
+
+    def combine(self, node: int):
+        left, right = 2 * node, 2 * node + 1
+        self.sum[node] = self.sum[left] + self.sum[right]
+        self.ect[node] = max(self.ect[right],
+                             self.ect[left] + self.sum[right])
+        # ties go to a gray task, so a gray value above the white one
+        # always has its task
+        self.gray_sum[node], self.sum_by[node] = max(
+            (self.gray_sum[left] + self.sum[right], self.sum_by[left]),
+            (self.sum[left] + self.gray_sum[right], self.sum_by[right]),
+            key=lambda c: (c[0], c[1] is not None))
+        self.gray_ect[node], self.ect_by[node] = max(
+            (self.gray_ect[right], self.ect_by[right]),
+            (self.ect[left] + self.gray_sum[right], self.sum_by[right]),
+            (self.gray_ect[left] + self.sum[right], self.ect_by[left]),
+            key=lambda c: (c[0], c[1] is not None))
+
+    def update(self, node: int):
+        node //= 2
+        while node:
+            self.combine(node)
+            node //= 2
+
+    # move task i from theta to lambda
+    def make_gray(self, i: int):
+        node = self.leaf[i]
+        self.sum[node], self.ect[node] = 0, no_overlap_bottom
+        self.sum_by[node] = self.ect_by[node] = i
+        self.update(node)
+
+    def remove(self, i: int):
+        node = self.leaf[i]
+        self.gray_sum[node], self.gray_ect[node] = 0, no_overlap_bottom
+        self.sum_by[node] = self.ect_by[node] = None
+        self.update(node)
+
+
+# the earliest starts raised by edge finding: when theta, the tasks
+# ending by some latest completion, cannot also hold task i, then i ends
+# after all of theta and starts at the earliest completion of theta
+# returns None if the tasks ending by some time do not fit
+def edge_finding(est: list, lct: list, durations: list):
+    tree = Theta_lambda_tree(est, durations)
+    new_est = list(est)
+    for j in sorted(range(len(est)), key=lambda i: lct[i], reverse=True):
+        if tree.ect[1] > lct[j]:
+            return None
+        while tree.gray_ect[1] > lct[j]:
+            i = tree.ect_by[1]
+            new_est[i] = max(new_est[i], tree.ect[1])
+            tree.remove(i)
+        tree.make_gray(j)
+    return new_est
+
+
+# the start masks of tasks on one resource, after timetabling and
+# edge finding in both directions until nothing changes
+# returns None when the tasks cannot all be placed
+def no_overlap_masks(masks: list, durations: list):
+    masks = list(masks)
+    while True:
+        if not all(masks):
+            return None
+        est = [lowest_bit(m) for m in masks]
+        lst = [highest_bit(m) for m in masks]
+        lct = [s + d for s, d in zip(lst, durations)]
+        new = list(masks)
+        # the slots from the latest start to the earliest end of a task
+        # are covered whatever its start, no other task can use them
+        for i, (latest, earliest) in enumerate(zip(lst, est)):
+            end = earliest + durations[i]
+            if latest >= end:
+                continue
+            for j, d in enumerate(durations):
+                if j != i:
+                    new[j] &= ~mask_upto(mask_from(-1, latest - d + 1),
+                                         end - 1)
+        later = edge_finding(est, lct, durations)
+        earlier = edge_finding([-t for t in lct], [-s for s in est],
+                               durations)
+        if later is None or earlier is None:
+            return None
+        for i, d in enumerate(durations):
+            new[i] = mask_upto(mask_from(new[i], later[i]), -earlier[i] - d)
+        if new == masks:
+            return masks
+        masks = new
+
+
+# a resource shared by the tasks of its constraint
+# the domains are revised for all the tasks at once, and the result is
+# kept for the arcs of the other tasks, which see the same domains
+class Unary_resource:
+    def __init__(self, name: str):
+        self.name = name
+        self.last = (None, None)   # the domains revised last, the result
+
+    def constraint(self, tasks: list):
+        return Constraint(tuple(dict.fromkeys(tasks)), no_overlap,
+                          self.propagate)
+
+    # propagator of no_overlap for var, see propagate_before
+    # domains of any representation are read as masks of starts
+    def propagate(self, const, var, domains: dict):
+        busy = [t for t in dict.fromkeys(const.scope)
+                if duration_of(domains[t]) > 0]
+        if var not in busy:
+            return domains[var]
+        key = (tuple(busy), tuple(domain_key(domains[t]) for t in busy))
+        if self.last[0] != key:
+            masks = no_overlap_masks([start_mask(domains[t]) for t in busy],
+                                     [duration_of(domains[t]) for t in busy])
+            self.last = (key, masks and dict(zip(busy, masks)))
+        revised = self.last[1]
+        if revised is None:
+            return restrict_domain(domains[var], lambda v: False)
+        mask = revised[var]
+        dom = domains[var]
+        if isinstance(dom, SlotDomain):
+            return dom.with_mask(mask)
+        return restrict_domain(dom, lambda v: (mask >> v[0]) & 1)
+
+
+# the starts of a domain as a mask, and the duration of its values
+def start_mask(dom):
+    if isinstance(dom, SlotDomain):
+        return dom.mask
+    mask = 0
+    for value in dom:
+        mask |= 1 << value[0]
+    return mask
+
+
+def duration_of(dom):
+    if hasattr(dom, 'duration'):
+        return dom.duration
+    return next((value[1] - value[0] for value in dom), 0)
+
+
 ''' cost computing '''
 
 
 # compute cost of a task with actual finish time and deadline
-def compute_single_cost(deadline: int, actual_time: int, cost: int):
-    actual_time = convert_to_hours(actual_time)
-    deadline = convert_to_hours(deadline)
+def compute_single_cost(deadline: int, actual_time: int, cost: int,
+                        calendar: Calendar = default_calendar):
+    actual_time = calendar.convert_to_hours(actual_time)
+    deadline = calendar.convert_to_hours(deadline)
 
     time_gap = actual_time - deadline
     if time_gap <= 0:
@@ -91,243 +473,1655 @@ def compute_single_cost(deadline: int, actual_time: int, cost: int):
 
 
 # compute cost from given schedule
-def compute_total_cost(schedule: dict, deadlines: dict, costs: dict):
+def compute_total_cost(schedule: dict, deadlines: dict, costs: dict,
+                       calendar: Calendar = default_calendar):
     cost = 0
     for k in schedule:
-        cost += compute_single_cost(deadlines[k], schedule[k], costs[k])
+        cost += compute_single_cost(deadlines[k], schedule[k], costs[k],
+                                    calendar)
     return cost
 
 
-''' read files '''
+''' compact domains '''
+
+
+# mask of all the slots of the calendar satisfying the given test
+def slot_mask(calendar: Calendar, test):
+    mask = 0
+    for s in range(calendar.size):
+        if test(s):
+            mask |= 1 << s
+    return mask
+
+
+# domain of a task kept as a bitmask of possible start slots
+# it behaves like the set of (start, end) tuples it stands for,
+# so the csp solver and the constraint functions can use it as is
+# the i-th bit stands for the value (i, i + duration)
+class SlotDomain(BitDomain):
+    __slots__ = ('duration',)
+
+    def __init__(self, duration: int, mask: int):
+        super().__init__(None, None, mask)
+        self.duration = duration
+
+    def with_mask(self, mask: int):
+        return SlotDomain(self.duration, mask)
+
+    # values are generated in chronological order
+    def value_at(self, i: int):
+        return (i, i + self.duration)
 
+    def index_of(self, value: tuple):
+        if value[0] >= 0 and value[1] == value[0] + self.duration:
+            return value[0]
+        return None
 
-# read domains
-# it also remove impossible values for domain
-# therefore this function is quite long
-def read_domain(sz_domain: str, possible_value: set,
-                duration: int):
+    def same_universe(self, other):
+        return (isinstance(other, SlotDomain)
+                and other.duration == self.duration)
+
+
+# compile one domain clause into a mask of allowed start slots
+# the soft deadline clause does not filter anything, it gives
+# the cost per hour and the deadline instead
+# clauses are shared by many tasks, so each one is compiled once
+@lru_cache(maxsize=None)
+def compile_domain(sz_domain: str, duration: int,
+                   calendar: Calendar = default_calendar):
     cost = 0
     deadline = 0
-    if 'starts-before' in sz_domain:
-        sz_domain = sz_domain.split(' ')[1:]
-        if len(sz_domain) == 1:
-            sz_domain = sz_domain[0]
-            possible_value = [
-                v for v in possible_value
-                if v % 100 <= time_dict[sz_domain]
-            ]
-        else:
-            sz_domain = ' '.join(sz_domain)
-            possible_value = [
-                v for v in possible_value
-                if v <= reversed_timeslot[sz_domain]
-            ]
-    elif 'ends-before' in sz_domain:
-        sz_domain = sz_domain.split(' ')[1:]
-        if len(sz_domain) == 1:
-            sz_domain = sz_domain[0]
-            possible_value = [
-                v for v in possible_value
-                if v % 100 + duration <= time_dict[sz_domain]
-            ]
-        else:
-            sz_domain = ' '.join(sz_domain)
-            possible_value = [
-                v for v in possible_value
-                if v + duration <= reversed_timeslot[sz_domain]
-            ]
-    elif 'starts-after' in sz_domain:
-        sz_domain = sz_domain.split(' ')[1:]
-        if len(sz_domain) == 1:
-            sz_domain = sz_domain[0]
-            possible_value = [
-                v for v in possible_value
-                if v % 100 >= time_dict[sz_domain]
-            ]
+    words = sz_domain.split(' ')
+    keyword, argument = words[0], ' '.join(words[1:])
+    hour_of = calendar.hour_of
+
+    # ends-* clauses are checked against the end of the task
+    offset = duration if keyword.startswith('ends') else 0
+
+    if keyword in ('starts-before', 'ends-before',
+                   'starts-after', 'ends-after'):
+        if argument in hour_name_dict:
+            def key(v): return hour_of[v] + offset
+            bound = calendar.lookup(calendar.time_dict, argument)
         else:
-            sz_domain = ' '.join(sz_domain)
-            possible_value = [
-                v for v in possible_value
-                if v >= reversed_timeslot[sz_domain]
-            ]
-    elif 'ends-after' in sz_domain:
-        sz_domain = sz_domain.split(' ')[1:]
-        if len(sz_domain) == 1:
-            sz_domain = sz_domain[0]
-            possible_value = [
-                v for v in possible_value
-                if v % 100 + duration >= time_dict[sz_domain]
-            ]
+            def key(v): return v + offset
+            bound = calendar.lookup(calendar.reversed_timeslot, argument)
+        if keyword.endswith('before'):
+            mask = slot_mask(calendar, lambda v: key(v) <= bound)
         else:
-            sz_domain = ' '.join(sz_domain)
-            possible_value = [
-                v for v in possible_value
-                if v + duration >= reversed_timeslot[sz_domain]
-            ]
-    elif 'starts-in' in sz_domain:
-        sz_domain = ' '.join(sz_domain.split(' ')[1:]).split('-')
-        possible_value = [
-            v for v in possible_value
-            if v >= reversed_timeslot[sz_domain[0]] and
-            v <= reversed_timeslot[sz_domain[1]]
-        ]
-    elif 'ends-in' in sz_domain:
-        sz_domain = ' '.join(sz_domain.split(' ')[1:]).split('-')
-        possible_value = [
-            v for v in possible_value
-            if v + duration >= reversed_timeslot[sz_domain[0]] and
-            v + duration <= reversed_timeslot[sz_domain[1]]
-        ]
-    elif sz_domain in week_dict:
-        possible_value = [
-            v for v in possible_value
-            if v // 100 == week_dict[sz_domain] // 100
-        ]
-    elif sz_domain in time_dict:
-        possible_value = [
-            v for v in possible_value
-            if v % 100 == time_dict[sz_domain] % 100
-        ]
-    elif 'ends-by' in sz_domain:
-        sz_domain = sz_domain.split(' ')[1:]
-        cost = int(sz_domain[-1])
-        deadline = reversed_timeslot[' '.join(sz_domain[:-1])]
-
-    return possible_value, cost, deadline
+            mask = slot_mask(calendar, lambda v: key(v) >= bound)
+    elif keyword in ('starts-in', 'ends-in'):
+        first, last = (calendar.lookup(calendar.reversed_timeslot, t)
+                       for t in argument.split('-'))
+        mask = slot_mask(calendar, lambda v: first <= v + offset <= last)
+    elif sz_domain in hour_name_dict:
+        hour = calendar.lookup(calendar.time_dict, sz_domain)
+        mask = slot_mask(calendar, lambda v: hour_of[v] == hour)
+    elif is_time_name(sz_domain):
+        day = calendar.lookup(calendar.week_dict, sz_domain)
+        mask = slot_mask(calendar, lambda v: calendar.day_of[v] == day)
+    else:
+        # an unknown keyword does not filter anything
+        mask = slot_mask(calendar, lambda v: True)
+        if keyword == 'ends-by':
+            cost = int(words[-1])
+            deadline = calendar.lookup(calendar.reversed_timeslot,
+                                       ' '.join(words[1:-1]))
+
+    return mask, cost, deadline
+
+
+# mask of the start slots where a task of the given
+# duration finishes within the same working day
+@lru_cache(maxsize=None)
+def compile_duration(duration: int, calendar: Calendar = default_calendar):
+    return slot_mask(calendar, lambda v: calendar.fits(v, duration))
+
+
+''' read files '''
+
+
+# split one line of a task file into a (keyword, fields) record
+# comments and blank lines give None
+def tokenize_line(line: str):
+    line = line.split('#', 1)[0]
+    keyword, comma, rest = line.partition(',')
+    keyword = keyword.strip()
+    if not comma or not keyword:
+        return None
+    return keyword, rest.split()
+
+
+# group task, domain, constraint, resource and pattern records
+# in a single sweep
+# task_file is either a file name or an iterable of lines,
+# so an open file object is streamed line by line
+# resource lines name a resource and tasks using it, so that
+# `resource, alice t1 t2 t3` keeps those tasks from overlapping;
+# the lines of one resource add up
+# pattern lines name one of patterns and the tasks it holds for, e.g.
+# `pattern, consecutive-days t1 t2 t3`
+def read_records(task_file):
+    if isinstance(task_file, str):
+        with open(task_file, 'r') as f:
+            return read_records(f)
+
+    durations = {}
+    clauses = {}
+    constraint_records = []
+    resources = {}
+    pattern_records = []
+    for line in task_file:
+        record = tokenize_line(line)
+        if record is None:
+            continue
+        keyword, fields = record
+        if keyword == 'task' and len(fields) >= 2:
+            durations[fields[0]] = int(fields[1])
+        elif keyword == 'domain' and len(fields) >= 2:
+            clauses.setdefault(fields[0], []).append(' '.join(fields[1:]))
+        elif keyword == 'constraint' and len(fields) >= 3:
+            constraint_records.append(tuple(fields[:3]))
+        elif keyword == 'resource' and len(fields) >= 2:
+            resources.setdefault(fields[0], []).extend(fields[1:])
+        elif keyword == 'pattern' and len(fields) >= 2:
+            pattern_records.append((fields[0], fields[1:]))
+    return durations, clauses, constraint_records, resources, pattern_records
+
+
+# condition and propagator of every constraint type
+# the numpy engine keeps the conditions and revises arcs
+# with vectorized propagators over boolean arrays
+engines = ('python', 'numpy')
+
+
+def relations(calendar: Calendar, engine: str = 'python'):
+    table = {
+        'before': (before, propagate_before),
+        'after': (after, propagate_after),
+        'same-day': (calendar.same_day, calendar.propagate_same_day),
+        'starts-at': (start_at, propagate_start_at),
+    }
+    if engine == 'numpy':
+        from numpyScheduler import numpy_propagators
+        propagators = numpy_propagators(calendar)
+        table = {k: (condition, propagators[k])
+                 for k, (condition, _) in table.items()}
+    return table
+
+
+# the values tasks may take together in a pattern, as tuples in the
+# order of the tasks, over the starts their durations allow
+# consecutive-days puts each task on the working day after the one
+# of the task before it
+def consecutive_days(durations: list, calendar: Calendar):
+    values_by_day = []
+    for duration in durations:
+        mask = compile_duration(duration, calendar)
+        by_day = {}
+        for s in range(calendar.size):
+            if (mask >> s) & 1:
+                by_day.setdefault(calendar.day_of[s], []).append(
+                    (s, s + duration))
+        values_by_day.append(by_day)
+    table = []
+    for first in range(len(calendar.week_dict) - len(durations) + 1):
+        table.extend(product(*(by_day.get(first + k, ())
+                               for k, by_day in enumerate(values_by_day))))
+    return table
+
+
+patterns = {'consecutive-days': consecutive_days}
+
+
+# the table constraint of a pattern line, see read_records
+def pattern_constraint(kind: str, users: list, durations: dict,
+                       calendar: Calendar = default_calendar):
+    if kind not in patterns:
+        raise ValueError('unknown pattern: {}'.format(kind))
+    return Table_constraint(users, patterns[kind](
+        [durations[t] for t in users], calendar))
 
 
 # read tasks, constraints and domain from given file
-def read_task(filename: str):
+# task_file is a file name or an open file object
+# times in the file are read against the given calendar
+# engine is one of engines, it chooses the domain representation
+def read_task(task_file, calendar: Calendar = default_calendar,
+              engine: str = 'python'):
     all_constraints = []
     all_domains = {}
     all_tasks = {}
-    with open(filename, 'r') as f:
-        content = f.read()
-
-        # fit content for regex expression
-        content = content + '\n'
-
-        # remove comment and extra spaces
-        content = re.sub('\s*#.*\n', '\n', content)
-        content = re.sub('[ ]+', ' ', content)
-        content = re.sub('\s*\n\s*', '\n', content)
-       #  print(content)
-
-        # init tasks
-        result = dict(re.findall(
-            'task,\s(.*?)\s(.*?)\n', content, re.S
-        ))
-
-        #print(result)
-
-        all_tasks = {k: {'duration': int(result[k])} for k in result}
-
-        # find domains for tasks
-        for t in all_tasks:
-            result = tuple(re.findall(
-                'domain,\s{}\s(.*?)\n'.format(t), content, re.S
-            ))
-
-            # valid start time. The result of start time + duration
-            # must to be in timeslot_mapping
-            possible_value = {
-                v for v in set(timeslot_mapping.keys())
-                if v + all_tasks[t]['duration'] in timeslot_mapping
-            }
-            task_cost = 0
-            soft_deadline = 0
-            for r in result:
-                possible_value, cost, deadline = \
-                    read_domain(r, possible_value,
-                                all_tasks[t]['duration'])
-                if cost != 0:
-                    task_cost = cost
-                    soft_deadline = deadline
-
-            # meta-info records the raw information about the
-            # domain from text file
-            all_tasks[t]['meta-info'] = result
-
-            # if a task have soft deadline, then
-            # the cost and deadlline are greater than 0
-            all_tasks[t]['cost'] = task_cost
-            all_tasks[t]['deadline'] = soft_deadline
-            all_domains[t] = {(start, start + all_tasks[t]['duration'])
-                              for start in possible_value}
-
-        # load all the constraints
-        result = tuple(re.findall(
-            'constraint,\s(.*?)\s(.*?)\s(.*?)\n', content, re.S))
-
-        # construct constraints
-        for t1, cons_type, t2 in result:
-            cons = None
-            if cons_type == 'before':
-                cons = Constraint((t1, t2), before)
-            elif cons_type == 'after':
-                cons = Constraint((t1, t2), after)
-            elif cons_type == "same-day":
-                cons = Constraint((t1, t2), same_day)
-            else:
-                cons = Constraint((t1, t2), start_at)
-            all_constraints.append(cons)
+    durations, clauses, constraint_records, resources, pattern_records = \
+        read_records(task_file)
+
+    all_tasks = {k: {'duration': durations[k]} for k in durations}
+
+    # find domains for tasks
+    # the compiled clauses of a task are intersected in one pass
+    for t in all_tasks:
+        result = tuple(clauses.get(t, ()))
+        duration = all_tasks[t]['duration']
+
+        # valid start time. The task must end
+        # in the same day of the calendar
+        possible_value = compile_duration(duration, calendar)
+        task_cost = 0
+        soft_deadline = 0
+        for r in result:
+            mask, cost, deadline = compile_domain(r, duration, calendar)
+            possible_value &= mask
+            if cost != 0:
+                task_cost = cost
+                soft_deadline = deadline
+
+        # meta-info records the raw information about the
+        # domain from text file
+        all_tasks[t]['meta-info'] = result
+
+        # if a task have soft deadline, then
+        # the cost and deadlline are greater than 0
+        all_tasks[t]['cost'] = task_cost
+        all_tasks[t]['deadline'] = soft_deadline
+        all_domains[t] = SlotDomain(duration, possible_value)
+
+    # construct constraints
+    # an unknown type is read as starts-at
+    relation_table = relations(calendar, engine)
+    for t1, cons_type, t2 in constraint_records:
+        condition, propagator = relation_table.get(
+            cons_type, relation_table['starts-at'])
+        all_constraints.append(Constraint((t1, t2), condition, propagator))
+    for name, users in resources.items():
+        if len(set(users)) > 1:
+            all_constraints.append(Unary_resource(name).constraint(users))
+    for kind, users in pattern_records:
+        all_constraints.append(pattern_constraint(kind, users, durations,
+                                                  calendar))
+
+    if engine == 'numpy':
+        from numpyScheduler import array_domains
+        all_domains = array_domains(all_domains, calendar.size)
 
     return all_tasks, all_constraints, all_domains
 
 
+''' rigid blocks '''
+
+
+# starts-at fixes the start of a task to the end of another, so tasks
+# linked by starts-at move together as one block with a single start
+# returns the parsed problem over the blocks: a block is named after
+# its first task and lasts until its last task ends, its domain is the
+# starts at which every task of it can start, and its task record
+# lists the (task, offset, record) of its tasks
+# the other constraints are moved onto the blocks of their tasks
+# slot domains are needed, other problems are returned as they are
+def contract_chains(parsed: tuple):
+    tasks, constraints, domains = parsed
+    if not all(isinstance(d, SlotDomain) for d in domains.values()):
+        return parsed
+    links = {t: [] for t in tasks}
+    for const in constraints:
+        if const.condition is start_at:
+            t1, t2 = const.scope
+            links[t2].append((t1, tasks[t2]['duration']))
+            links[t1].append((t2, -tasks[t2]['duration']))
+
+    # offsets of the tasks from the first task of their block
+    order = {t: i for i, t in enumerate(tasks)}
+    place = {}
+    blocks = []
+    for first in tasks:
+        if first in place:
+            continue
+        offsets, feasible = {first: 0}, True
+        to_visit = [first]
+        while to_visit:
+            t1 = to_visit.pop()
+            for t2, w in links[t1]:
+                if t2 not in offsets:
+                    offsets[t2] = offsets[t1] + w
+                    to_visit.append(t2)
+                elif offsets[t2] != offsets[t1] + w:
+                    feasible = False   # a cycle of starts-at
+        least = min(offsets.values())
+        members = sorted(offsets, key=lambda t: (offsets[t], order[t]))
+        for t in members:
+            place[t] = (members[0], offsets[t] - least)
+        blocks.append((members, feasible))
+
+    block_tasks, block_domains = {}, {}
+    for members, feasible in blocks:
+        name = members[0]
+        if len(members) == 1:
+            block_tasks[name], block_domains[name] = tasks[name], domains[name]
+            continue
+        mask = -1 if feasible else 0
+        for t in members:
+            mask &= domains[t].mask >> place[t][1]
+        span = max(place[t][1] + tasks[t]['duration'] for t in members)
+        block_tasks[name] = {
+            'duration': span,
+            'cost': sum(tasks[t]['cost'] for t in members),
+            'deadline': 0,
+            'members': [(t, place[t][1], tasks[t]) for t in members]}
+        block_domains[name] = SlotDomain(span, mask)
+
+    in_blocks = {t for members, _ in blocks if len(members) > 1
+                 for t in members}
+    block_constraints = []
+    for const in constraints:
+        if in_blocks.isdisjoint(const.scope):
+            block_constraints.append(const)
+        elif const.condition is not start_at:
+            block_constraints.append(
+                block_constraint(const, place, tasks))
+    return block_tasks, block_constraints, block_domains
+
+
+# the value of a task of a block given the value of the block
+def member_value(value: tuple, offset: int, duration: int):
+    return (value[0] + offset, value[0] + offset + duration)
+
+
+# const moved onto the blocks of its tasks
+# the propagator of const revises the domains the tasks have within
+# their blocks; a constraint within one block is checked value by value
+def block_constraint(const: Constraint, place: dict, tasks: dict):
+    view = Block_view(const, place, tasks)
+    return Constraint(view.scope, view, view.propagate)
+
+
+# const seen from the blocks of its tasks, called as the condition
+# of the moved constraint; unlike closures, it can be pickled, so the
+# contracted problem can be sent to other processes
+class Block_view:
+    def __init__(self, const: Constraint, place: dict, tasks: dict):
+        self.const = const
+        self.scope = tuple(place[t][0] for t in const.scope)
+        self.views = [(t, place[t][0], place[t][1], tasks[t]['duration'])
+                      for t in const.scope]
+        self.__name__ = const.condition.__name__
+
+    def __call__(self, *values):
+        return self.const.condition(*(
+            member_value(v, offset, duration)
+            for v, (_, _, offset, duration) in zip(values, self.views)))
+
+    def propagate(self, block_const, var, domains: dict):
+        if len(set(self.scope)) < len(self.scope):
+            return None
+        member_domains = {t: SlotDomain(duration, domains[b].mask << offset)
+                          for t, b, offset, duration in self.views}
+        for t, b, offset, _ in self.views:
+            if b == var:
+                revised = self.const.propagate(t, member_domains)
+                if revised is None:
+                    return None
+                return domains[var].with_mask(
+                    domains[var].mask & (revised.mask >> offset))
+
+
+# the start of every task given the starts of the blocks
+def expand_blocks(starts: dict, block_tasks: dict):
+    expanded = {}
+    for k, v in starts.items():
+        for t, offset, _ in block_tasks[k].get('members', [(k, 0, None)]):
+            expanded[t] = v + offset
+    return expanded
+
+
+# searchers that can be chosen: A* keeps every open node,
+# depth-first branch and bound and IDA* only the nodes along one branch,
+# SMA* drops the worst open nodes past a budget,
+# parallel branch and bound shares subtrees between workers processes
+searchers = ('astar', 'bnb', 'ida', 'sma', 'parallel')
+
+
+# search one schedule for the given tasks
+# returns the starts found as task: start slot, or None,
+# whether no cheaper schedule exists, and a lower bound on the cost
+# with prune, A* searches nodes with the same domains once,
+# keeping the pruning table within memory_budget bytes
+# SMA* keeps at most max_nodes open nodes of at most memory_budget bytes
+# with time_limit seconds or max_expanded nodes, the search is anytime:
+# report(cost) is called for each better schedule found, and the best
+# schedule is returned with the lower bound if it is not proven optimal
+# search_options are passed on to Search_with_AC_from_Cost_CSP
+def search_schedule(tasks: dict, constraints: list, domains: dict,
+                    calendar: Calendar = default_calendar,
+                    search: str = 'astar', prune: bool = False,
+                    memory_budget: int = None, max_nodes: int = None,
+                    time_limit: float = None, max_expanded: int = None,
+                    report=None, workers: int = None, **search_options):
+    schedule_csp = MyCSP(domains, constraints, tasks, calendar)
+    problem = Search_with_AC_from_Cost_CSP(schedule_csp, **search_options)
+    anytime = time_limit is not None or max_expanded is not None
+    if anytime:
+        searcher = Anytime_branch_and_bound(
+            problem, time_limit=time_limit, max_expanded=max_expanded,
+            report=report and (lambda path, cost: report(cost)))
+    elif search == 'bnb':
+        searcher = DF_branch_and_bound(problem)
+    elif search == 'ida':
+        searcher = IDAStarSearcher(problem)
+    elif search == 'sma':
+        searcher = SMAStarSearcher(problem, max_nodes, memory_budget)
+    elif search == 'parallel':
+        searcher = Parallel_branch_and_bound(problem, workers)
+    elif prune:
+        searcher = AStarSearcherMPP(problem, memory_budget)
+    else:
+        searcher = AStarSearcher(problem)
+    searcher.max_display_level = 0
+    path = searcher.search()
+
+    starts = None if path is None else {
+        k: select(v)[0] for k, v in path.end().items()}
+    if anytime:
+        return starts, searcher.optimal, searcher.lower_bound
+    return starts, True, None if path is None else problem.heuristic(
+        path.end())
+
+
+# the tasks of a file in the given list, with the constraints among them
+def restrict_tasks(parsed: tuple, variables: list):
+    tasks, constraints, domains = parsed
+    chosen = set(variables)
+    return ({k: tasks[k] for k in variables},
+            [c for c in constraints if chosen.issuperset(c.scope)],
+            {k: domains[k] for k in variables})
+
+
+# search the schedule of one component in a worker process
+# the item holds the tasks, constraints and domains of the component
+def search_component(item: tuple):
+    parsed, calendar, options = item
+    return search_schedule(*parsed, calendar, **options)
+
+
+# the options of a component searched with a share of the budget:
+# the time and nodes left over parts, the components still to search
+def share_budget(search_options: dict, parts: int, time_left: float = None,
+                 expanded_left: int = None):
+    options = dict(search_options)
+    if time_left is not None:
+        options['time_limit'] = max(0.0, time_left) / parts
+    if expanded_left is not None:
+        options['max_expanded'] = max(0, expanded_left) // parts
+    return options
+
+
 # search one schedule for one file
-def get_one_schedule(filename):
+# returns the output lines instead of printing them
+# with decompose, tasks that no chain of constraints links are
+# scheduled separately, as the cost is a sum over the tasks, and with
+# workers, unless the search is parallel itself, over as many processes
+# a time or node budget is then shared by the components: searched one
+# after another, each gets an equal share of what the previous ones
+# left, and over processes, each process splits the time among the
+# components it gets; only a problem that is not split reports better
+# schedules
+# with contract, tasks linked by starts-at are searched as one block
+# the other options are those of search_schedule
+def solve_schedule(filename, calendar: Calendar = default_calendar,
+                   engine: str = 'python', decompose: bool = False,
+                   contract: bool = False, report=None, workers: int = None,
+                   **search_options):
     '''
     tasks keeps meta information: task name, task duration
     domains keeps possible values for tasks
     constraints contains two tasks and one condition
     costs is task_name: cost_per_hour key-value pairs
     '''
-    tasks, constraints, domains = read_task(filename)
-    deadlines = {k: tasks[k]['deadline'] for k in tasks}
-    costs = {k: tasks[k]['cost'] for k in tasks}
-
-    schedule_csp = MyCSP(domains, constraints, tasks)
-    searcher = AStarSearcher(Search_with_AC_from_Cost_CSP(schedule_csp))
-    searcher.max_display_level = 0
-    path = searcher.search()
+    tasks, constraints, domains = read_task(filename, calendar, engine)
+    parsed = (tasks, constraints, domains)
+    if contract:
+        parsed = contract_chains(parsed)
+    components = [list(parsed[2])]
+    if decompose:
+        components = CSP(parsed[2], parsed[1]).components()
+    if len(components) == 1:
+        results = [search_schedule(*parsed, calendar, report=report,
+                                   workers=workers, **search_options)]
+    elif workers and search_options.get('search') != 'parallel':
+        options = share_budget(search_options, len(components),
+                               None, search_options.get('max_expanded'))
+        if options.get('time_limit') is not None:
+            # every process searches about as many components in turn
+            options['time_limit'] /= -(-len(components) // workers)
+        items = [(restrict_tasks(parsed, variables), calendar, options)
+                 for variables in components]
+        chunksize = max(1, len(items) // (4 * workers))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(search_component, items,
+                                        chunksize=chunksize))
+    else:
+        time_limit = search_options.get('time_limit')
+        max_expanded = search_options.get('max_expanded')
+        deadline = None if time_limit is None else \
+            time.perf_counter() + time_limit
+        results = []
+        for k, variables in enumerate(components):
+            options = share_budget(
+                search_options, len(components) - k,
+                None if deadline is None else
+                deadline - time.perf_counter(),
+                max_expanded)
+            if max_expanded is not None:
+                max_expanded -= options['max_expanded']
+            results.append(search_schedule(
+                *restrict_tasks(parsed, variables), calendar,
+                workers=workers, **options))
 
-    if path is None:
-        print('No solution')
+    optimal = all(proved for _, proved, _ in results)
+    if any(starts is None and proved for starts, proved, _ in results):
+        lines = ['No solution']
+    elif any(starts is None for starts, _, _ in results):
+        lines = ['No schedule found within the budget']
     else:
-        assignments = {k: v.pop()[0] for k, v in path.end().items()}
-        for k, v in assignments.items():
-            print('{}:{}'.format(k, timeslot_mapping[v]))
-        assignments = {k: v + tasks[k]['duration']
-                       for k, v in assignments.items()}
-        total_cost = compute_total_cost(assignments, deadlines, costs)
-        print('cost:{}'.format(total_cost))
+        starts = {}
+        for part, _, _ in results:
+            starts.update(expand_blocks(part, parsed[0]))
+        lines = schedule_lines({k: starts[k] for k in domains},
+                               tasks, calendar)
+    if not optimal:
+        lines.append('lower-bound:{}'.format(
+            sum(bound for _, _, bound in results)))
+    return lines
+
+
+# output lines of a schedule given as task: start slot
+def schedule_lines(starts: dict, tasks: dict,
+                   calendar: Calendar = default_calendar):
+    lines = ['{}:{}'.format(k, calendar.timeslot_mapping[v])
+             for k, v in starts.items()]
+    ends = {k: v + tasks[k]['duration'] for k, v in starts.items()}
+    total_cost = compute_total_cost(
+        ends, {k: tasks[k]['deadline'] for k in tasks},
+        {k: tasks[k]['cost'] for k in tasks}, calendar)
+    lines.append('cost:{}'.format(total_cost))
+    return lines
+
+
+# print each better schedule found by an anytime search
+def report_cost(cost):
+    print('found cost:{} after {:.2f}s'.format(
+        cost, time.perf_counter() - report_cost.start), file=sys.stderr)
+
+
+# search one schedule for one file and print it
+def get_one_schedule(filename, calendar: Calendar = default_calendar,
+                     engine: str = 'python', **search_options):
+    report_cost.start = time.perf_counter()
+    for line in solve_schedule(filename, calendar, engine,
+                               report=report_cost, **search_options):
+        print(line)
 
 
 # adds costs and deadlines as the class members
+# a block of tasks, see contract_chains, keeps the tasks it stands for
 class MyCSP(CSP):
-    def __init__(self, domains: dict, constraints: Constraint, tasks: dict):
+    def __init__(self, domains: dict, constraints: Constraint, tasks: dict,
+                 calendar: Calendar = default_calendar):
         super().__init__(domains, constraints)
         self.costs = {k: tasks[k]['cost'] for k in tasks}
         self.deadlines = {k: tasks[k]['deadline'] for k in tasks}
+        self.calendar = calendar
+        self.blocks = {k: (tasks[k]['duration'], tasks[k]['members'])
+                       for k in tasks if 'members' in tasks[k]}
 
+    # the cost of var if it ends at end
+    # a block costs what its tasks cost when it ends there
+    def task_cost(self, var, end: int):
+        if var not in self.blocks:
+            return compute_single_cost(self.deadlines[var], end,
+                                       self.costs[var], self.calendar)
+        span, members = self.blocks[var]
+        return sum(compute_single_cost(
+            task['deadline'], end - span + offset + task['duration'],
+            task['cost'], self.calendar) for _, offset, task in members)
 
-class Search_with_AC_from_Cost_CSP(Search_with_AC_from_CSP):
+
+# split first the task that could cost the most, that is
+# cost per hour times the hours its latest end is past the deadline
+# tasks that cannot be late fall back to the smallest domain first
+class Largest_penalty_first(Smallest_domain_first):
+    def latest_end(self, dom):
+        if isinstance(dom, SlotDomain):
+            return highest_bit(dom.mask) + dom.duration
+        return max(value[1] for value in dom)
+
+    def penalty(self, var, dom):
+        if self.csp.costs[var] == 0 or len(dom) == 0:
+            return 0
+        return self.csp.task_cost(var, self.latest_end(dom))
+
+    def select_var(self, iter_vars, domains: dict):
+        variables = list(iter_vars)
+        best = max(variables, default=None,
+                   key=lambda var: self.penalty(var, domains[var]))
+        if best is None or self.penalty(best, domains[best]) == 0:
+            return super().select_var(variables, domains)
+        return best
+
+
+# variable orderings that can be chosen for splitting
+orderings = {'first': Variable_ordering, 'mrv': Smallest_domain_first,
+             'degree': Most_constrained_first, 'domwdeg': Dom_wdeg,
+             'penalty': Largest_penalty_first}
+
+
+# split off the starts that meet the soft deadline first, so that
+# the search reaches schedules without penalty sooner
+# a domain that is all on time or all late is bisected in time order
+class Deadline_first_splitting(Ordered_bisection):
     def __init__(self, csp: CSP):
         super().__init__(csp)
+        self.on_time_masks = {}
+
+    # the values of dom ending by the deadline of var, or the others if late
+    def on_time(self, var, dom, late: bool = False):
+        def test(value):
+            return late != (self.csp.task_cost(var, value[1]) == 0)
+
+        if isinstance(dom, SlotDomain):
+            # the on time starts are computed once from the initial domain
+            if var not in self.on_time_masks:
+                self.on_time_masks[var] = restrict_domain(
+                    self.csp.domains[var],
+                    lambda value: self.csp.task_cost(var, value[1]) == 0
+                ).mask
+            on_time = self.on_time_masks[var]
+            return dom.with_mask(dom.mask & ~on_time if late
+                                 else dom.mask & on_time)
+        return restrict_domain(dom, test)
+
+    def split(self, var, dom):
+        if self.csp.costs[var] != 0:
+            on_time = self.on_time(var, dom)
+            if 0 < len(on_time) < len(dom):
+                return on_time, self.on_time(var, dom, late=True)
+        return super().split(var, dom)
+
+
+# lower bound on the cost of the schedules within the domains of a node
+# a task ends at the earliest at the end of its earliest start, so it
+# costs at least its cost per hour times the hours that end is past
+# its deadline, and nothing if that end meets the deadline
+# precedences need no extra term, as arc consistency already moved
+# the earliest starts past the earliest ends of the tasks before
+class Cost_bound:
+    max_nodes = 4096   # bounds of recent nodes kept for their neighbors
+
+    def __init__(self, csp: CSP):
         self.csp = csp
-        # sort variables by the earliest starting time
-        self.variables = set(sorted(csp.domains, key=lambda t: csp.domains[t]))
+        self.costly = [var for var in csp.domains if csp.costs[var] != 0]
+        self.bounds = OrderedDict()   # id of a node: (node, its bound)
+
+    def earliest_end(self, dom):
+        if isinstance(dom, SlotDomain):
+            return lowest_bit(dom.mask) + dom.duration
+        if isinstance(dom, Domain):
+            return next(iter(dom))[1]   # values are in time order
+        return min(value[1] for value in dom)
+
+    def task_bound(self, var, dom):
+        if len(dom) == 0:
+            return 0
+        return self.csp.task_cost(var, self.earliest_end(dom))
+
+    # keeps the bound of a node, forgetting the oldest ones
+    # the node is kept too, so its id is not reused meanwhile
+    def remember(self, node, bound):
+        self.bounds[id(node)] = (node, bound)
+        if len(self.bounds) > self.max_nodes:
+            self.bounds.popitem(last=False)
+
+    # the bound of a node, computed in full if it was forgotten
+    def of(self, node):
+        entry = self.bounds.get(id(node))
+        if entry is not None and entry[0] is node:
+            return entry[1]
+        bound = sum(self.task_bound(var, node[var]) for var in self.costly)
+        self.remember(node, bound)
+        return bound
+
+    # the bounds of the neighbors of an expanded node, which only differ
+    # from the bound of the node in the domains that were split or pruned
+    def expand(self, node, neighbors: list):
+        bound = self.of(node)
+        del self.bounds[id(node)]
+        for neighbor in neighbors:
+            self.remember(neighbor, bound + sum(
+                self.task_bound(var, neighbor[var])
+                - self.task_bound(var, node[var])
+                for var in self.costly if neighbor[var] is not node[var]))
+
+
+# domain splitting strategies that can be chosen
+splitters = {'bisect': Ordered_bisection, 'deadline': Deadline_first_splitting,
+             'enumerate': Value_enumeration}
+
+
+''' simple temporal network '''
+
+
+# before, after and starts-at bound the difference of two start slots,
+# e.g. t1 before t2 is s2 - s1 >= duration of t1, so they form a
+# simple temporal network: the earliest starts are longest paths from
+# the earliest starts of the domains, the latest starts likewise
+# backwards, and a cycle that keeps raising them is infeasible
+# edges[t1] lists the (t2, w) for which s2 >= s1 + w
+# bounded holds the constraints that only depend on the bounds,
+# which are arc consistent once the network is
+class Simple_temporal_network:
+    def __init__(self, csp: CSP):
+        self.csp = csp
+        self.edges = {var: [] for var in csp.domains}
+        self.reverse = {var: [] for var in csp.domains}
+        self.bounded = set()
+        for const in csp.constraints:
+            if (len(const.scope) != 2
+                    or slot_domains(const, csp.domains)[0] is None):
+                continue
+            t1, t2 = const.scope
+            d1, d2 = (csp.domains[t].duration for t in const.scope)
+            if const.condition is before:
+                self.add_edge(t1, t2, d1)
+                self.bounded.add(const)
+            elif const.condition is after:
+                self.add_edge(t2, t1, d2)
+                self.bounded.add(const)
+            elif const.condition is start_at:
+                self.add_edge(t2, t1, d2)
+                self.add_edge(t1, t2, -d2)
+
+    def add_edge(self, t1, t2, w: int):
+        self.edges[t1].append((t2, w))
+        self.reverse[t2].append((t1, w))
+
+    # tighten the earliest and latest starts in domains, in place,
+    # following the edges from the tasks in changed, or from all tasks
+    # a bound that falls in a hole of a domain moves on to the next
+    # start there, so the bounds are those of the tightened domains
+    # returns the tasks whose domains were tightened,
+    # or None when there is no schedule
+    def propagate(self, domains, changed=None):
+        if changed is None:
+            changed = self.edges
+        changed = [t for t in changed if self.edges[t] or self.reverse[t]]
+        earliest, latest = {}, {}
+
+        def bounds(t):
+            if t not in earliest:
+                mask = domains[t].mask
+                earliest[t], latest[t] = lowest_bit(mask), highest_bit(mask)
+            return earliest[t] <= latest[t]
+
+        if not all(bounds(t) for t in changed):
+            return None
+        for edges, later in ((self.edges, True), (self.reverse, False)):
+            to_visit = deque(changed)
+            visits = {}
+            while to_visit:
+                t1 = to_visit.popleft()
+                for t2, w in edges[t1]:
+                    if not bounds(t2):
+                        return None
+                    mask = domains[t2].mask
+                    if later and earliest[t1] + w > earliest[t2]:
+                        earliest[t2] = lowest_bit(
+                            mask_from(mask, earliest[t1] + w))
+                    elif not later and latest[t1] - w < latest[t2]:
+                        latest[t2] = highest_bit(
+                            mask_upto(mask, latest[t1] - w))
+                    else:
+                        continue
+                    visits[t2] = visits.get(t2, 0) + 1
+                    if (earliest[t2] > latest[t2] or earliest[t2] < 0
+                            or visits[t2] > len(self.edges)):
+                        return None    # a cycle keeps raising the bounds
+                    to_visit.append(t2)
+        tightened = set()
+        for t in earliest:
+            dom = domains[t]
+            mask = mask_upto(mask_from(dom.mask, earliest[t]), latest[t])
+            if mask != dom.mask:
+                domains[t] = dom.with_mask(mask)
+                tightened.add(t)
+        return tightened
+
+
+# arc consistency after the temporal network has tightened the starts,
+# so long chains of precedences settle in one pass instead of many
+# sweeps; only the arcs the network does not make consistent are
+# revised, and AC follows any further pruning as usual
+class STN_con_solver(Con_solver):
+    def __init__(self, csp: CSP):
+        super().__init__(csp)
+        self.stn = Simple_temporal_network(csp)
+
+    def make_arc_consistent(self, orig_domains=None, to_do=None,
+                            in_place=False):
+        if orig_domains is None:
+            orig_domains = self.csp.domains
+        domains = orig_domains if in_place else orig_domains.copy()
+        if to_do is None:
+            to_do = {(var, const) for const in self.csp.constraints
+                     for var in const.scope}
+            changed = None
+        else:
+            changed = {v for _, const in to_do for v in const.scope}
+        tightened = self.stn.propagate(domains, changed)
+        if tightened is None:
+            var = next(iter(changed or domains))
+            domains[var] = domains[var].with_mask(0)
+            return domains
+        for var in tightened:
+            to_do = to_do | self.new_to_do(var, None)
+        to_do = {arc for arc in to_do if arc[1] not in self.stn.bounded}
+        return super().make_arc_consistent(domains, to_do, in_place=True)
+
+
+# with persistent, frontier nodes share the domains
+# they did not change, see Persistent_domains
+# ordering and split name the variable ordering and
+# the domain splitting strategy
+# cost_limit gives the cost of the best schedule known elsewhere,
+# nodes that cannot be cheaper are not searched
+# domains are arc consistent domains to start from, if already known
+# with stn, the temporal network tightens the starts before each AC
+class Search_with_AC_from_Cost_CSP(Search_with_AC_from_CSP):
+    def __init__(self, csp: CSP, persistent: bool = False,
+                 ordering: str = 'first', split: str = 'bisect',
+                 cost_limit=None, domains: dict = None, stn: bool = False):
+        super().__init__(csp, persistent=persistent,
+                         solver_class=STN_con_solver if stn else Con_solver,
+                         ordering=orderings[ordering],
+                         splitter=splitters[split], domains=domains)
+        self.csp = csp
+        self.bound = Cost_bound(csp)
+        self.cost_limit = cost_limit
 
     def heuristic(self, node):
-        result = [0] + list(accumulate((
-            min(node[var])[1] - self.csp.deadlines[var]) * self.csp.costs[var]
-            for var in node
-            if self.csp.costs[var] != 0 and len(node[var]) > 0))
-        return result[-1]
+        return self.bound.of(node)
+
+    # splitting costs nothing, so the A* value of a node is its cost bound
+    # and the first schedule found has the lowest cost
+    def neighbors(self, node):
+        arcs = super().neighbors(node)
+        for arc in arcs:
+            arc.cost = 0
+        self.bound.expand(node, [arc.to_node for arc in arcs])
+        if self.cost_limit is not None:
+            limit = self.cost_limit()
+            arcs = [arc for arc in arcs
+                    if self.bound.of(arc.to_node) < limit]
+        return arcs
+
+
+# build the calendar from the command line options
+# hours are given as a range such as 9am-5pm
+def parse_calendar(days: str, hours: str, weeks: int):
+    first_hour, last_hour = (
+        hour_name_dict[h] for h in hours.lower().split('-'))
+    return Calendar(days.lower().split(','), first_hour, last_hour, weeks)
+
+
+''' batch mode '''
+
+
+# expand directories into the task files they contain
+def collect_task_files(paths: list, pattern: str = 'input*.txt'):
+    task_files = []
+    for p in paths:
+        if os.path.isdir(p):
+            task_files.extend(sorted(glob.glob(os.path.join(p, pattern))))
+        else:
+            task_files.append(p)
+    return task_files
+
+
+# output file of some task file, input1.txt gives output1.txt
+def output_name(filename: str, out_dir: str):
+    name = os.path.basename(filename)
+    if 'input' in name:
+        name = name.replace('input', 'output', 1)
+    else:
+        name = name + '.out'
+    return os.path.join(out_dir, name)
+
+
+# solve one file of a batch in a worker process
+# a failure is reported back instead of breaking the whole batch
+def solve_batch_item(item: tuple):
+    filename, calendar, engine, search_options = item
+    start = time.perf_counter()
+    try:
+        lines = solve_schedule(filename, calendar, engine, **search_options)
+        error = None
+    except Exception as e:
+        lines, error = None, '{}: {}'.format(type(e).__name__, e)
+    return filename, lines, error, time.perf_counter() - start
+
+
+# solve the items given by index in todo over a pool of processes,
+# with at most jobs of them submitted at a time, and store(i, result)
+# each result; when a process of the pool dies, the pool is broken:
+# returns the indexes in flight then, the others are left in todo
+def batch_pool(items: list, todo: deque, jobs: int, store):
+    in_flight = {}
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        while todo or in_flight:
+            while todo and len(in_flight) < jobs:
+                i = todo.popleft()
+                in_flight[executor.submit(solve_batch_item, items[i])] = i
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    store(in_flight[future], future.result())
+                except BrokenProcessPool:
+                    return sorted(in_flight.values())
+                del in_flight[future]
+    return []
+
+
+# solve the items given by index, each in a pool of its own process,
+# so that a process that dies gives the failure of its own file only
+def batch_alone(items: list, indexes: list, store):
+    started = time.perf_counter()
+    pools = {i: ProcessPoolExecutor(max_workers=1) for i in indexes}
+    futures = {i: pools[i].submit(solve_batch_item, items[i])
+               for i in indexes}
+    for i in indexes:
+        try:
+            store(i, futures[i].result())
+        except BrokenProcessPool:
+            store(i, (items[i][0], None, 'the worker process died',
+                      time.perf_counter() - started))
+        pools[i].shutdown()
+
+
+# solve task files over a pool of processes
+# results come back in the order of task_files, whatever
+# the order the workers finish in
+# a worker process that dies, e.g. killed when out of memory, breaks
+# the pool: the files it was solving are solved again one per process
+# to find the one that failed, and the rest go on in a new pool
+# returns the number of failed files
+def solve_batch(task_files: list, calendar: Calendar = default_calendar,
+                jobs: int = None, out_dir: str = None,
+                engine: str = 'python', **search_options):
+    items = [(f, calendar, engine, search_options) for f in task_files]
+    if out_dir is not None:
+        outputs = {}
+        for f in task_files:
+            name = output_name(f, out_dir)
+            if name in outputs:
+                raise ValueError('{} and {} would both be written to {}'
+                                 .format(outputs[name], f, name))
+            outputs[name] = f
+    jobs = jobs or os.cpu_count() or 1
+    results = [None] * len(items)
+    failures = 0
+    printed = 0
+
+    # print the results that are ready, in the order of task_files
+    def store(i: int, result: tuple):
+        nonlocal failures, printed
+        results[i] = result
+        while printed < len(results) and results[printed] is not None:
+            filename, lines, error, elapsed = results[printed]
+            printed += 1
+            if error is not None:
+                failures += 1
+                print('{}: failed after {:.3f}s, {}'.format(
+                    filename, elapsed, error), file=sys.stderr)
+                continue
+            print('{}: {:.3f}s'.format(filename, elapsed), file=sys.stderr)
+            if out_dir is None:
+                print('==> {} <=='.format(filename))
+                print('\n'.join(lines))
+            else:
+                with open(output_name(filename, out_dir), 'w') as f:
+                    f.write('\n'.join(lines) + '\n')
+
+    todo = deque(range(len(items)))
+    while todo:
+        broken = batch_pool(items, todo, jobs, store)
+        batch_alone(items, broken, store)
+    return failures
+
+
+''' portfolio mode '''
+
+
+# configurations raced by default, in the order processes get them
+# A* and branch and bound prove optimality when they finish,
+# depth-first search quickly finds some schedule
+portfolio_configurations = (
+    {'search': 'astar', 'ordering': 'first', 'split': 'bisect'},
+    {'search': 'bnb', 'ordering': 'penalty', 'split': 'deadline'},
+    {'search': 'dfs', 'ordering': 'mrv', 'split': 'deadline'},
+    {'search': 'bnb', 'ordering': 'domwdeg', 'split': 'bisect'},
+    {'search': 'astar', 'ordering': 'penalty', 'split': 'deadline'},
+    {'search': 'bnb', 'ordering': 'mrv', 'split': 'enumerate'},
+)
+
+
+# run one configuration on the parsed problem in its own process
+# every schedule cheaper than best_cost is sent to results as
+# ('schedule', cost, starts), then ('done', index, proved) when finished
+# options are passed on to Search_with_AC_from_Cost_CSP
+def portfolio_worker(parsed: tuple, calendar: Calendar, config: dict,
+                     best_cost, results, index: int = 0,
+                     options: dict = None):
+    proved = False
+    try:
+        tasks, constraints, domains = parsed
+        problem = Search_with_AC_from_Cost_CSP(
+            MyCSP(domains, constraints, tasks, calendar),
+            ordering=config['ordering'], split=config['split'],
+            cost_limit=lambda: best_cost.value, **(options or {}))
+
+        def report(path, cost):
+            with best_cost.get_lock():
+                if cost < best_cost.value:
+                    results.put(('schedule', cost, {
+                        k: select(v)[0] for k, v in path.end().items()}))
+                    best_cost.value = cost
+
+        if config['search'] == 'bnb':
+            searcher = Anytime_branch_and_bound(problem, report=report)
+        elif config['search'] == 'astar':
+            searcher = AStarSearcher(problem)
+        else:
+            searcher = Searcher(problem)
+        searcher.max_display_level = 0
+        path = searcher.search()
+        if path is not None and config['search'] != 'bnb':
+            report(path, problem.heuristic(path.end()))
+        # no schedule is cheaper than the best one known
+        proved = config['search'] != 'dfs'
+    finally:
+        results.put(('done', index, proved))
+
+
+# race configurations on one file, one process each, at most jobs of them
+# the processes share the best cost, so each only searches for cheaper
+# schedules, and the rest are stopped once one has proved optimality
+# a process that dies, e.g. killed when out of memory, proves nothing
+# with time_limit seconds, the race is stopped then, and the best
+# schedule found is returned with a lower bound if it is not proven
+# optimal; stn, persistent and contract are as for solve_schedule
+def solve_portfolio(filename, calendar: Calendar = default_calendar,
+                    engine: str = 'python', jobs: int = None,
+                    configurations: tuple = portfolio_configurations,
+                    time_limit: float = None, contract: bool = False,
+                    **options):
+    tasks, constraints, domains = read_task(filename, calendar, engine)
+    parsed = (tasks, constraints, domains)
+    if contract:
+        parsed = contract_chains(parsed)
+    configurations = configurations[:jobs or os.cpu_count() or 1]
+    best_cost = multiprocessing.Value('d', float('inf'))
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(
+        target=portfolio_worker, daemon=True,
+        args=(parsed, calendar, config, best_cost, results, i, options))
+        for i, config in enumerate(configurations)]
+    for w in workers:
+        w.start()
+
+    deadline = None if time_limit is None else \
+        time.perf_counter() + time_limit
+    cost, starts = float('inf'), None
+    done = {}       # index of a finished process: whether it proved
+    # the schedule with the shared best cost may still be on its way
+    while not ((any(done.values()) or len(done) == len(workers))
+               and cost == best_cost.value):
+        if deadline is not None and time.perf_counter() >= deadline:
+            break
+        try:
+            message = results.get(timeout=0.1)
+        except queue.Empty:
+            for i, w in enumerate(workers):
+                if w.exitcode is not None:
+                    done.setdefault(i, False)
+            # every message of the exited processes has been read
+            if all(w.exitcode is not None for w in workers):
+                break
+            continue
+        if message[0] == 'schedule':
+            if message[1] < cost:
+                cost, starts = message[1], message[2]
+        else:
+            done[message[1]] = message[2]
+    proved = any(done.values())
+    for w in workers:
+        w.terminate()
+        w.join()
+
+    if starts is None:
+        return ['No solution' if proved else
+                'No schedule found within the budget']
+    starts = expand_blocks(starts, parsed[0])
+    lines = schedule_lines({k: starts[k] for k in domains}, tasks, calendar)
+    if not proved:
+        problem = Search_with_AC_from_Cost_CSP(
+            MyCSP(parsed[2], parsed[1], parsed[0], calendar), **options)
+        lines.append('lower-bound:{}'.format(
+            problem.heuristic(problem.start_node())))
+    return lines
+
+
+''' incremental re-solving '''
+
+
+# split off the start a task had in the last schedule, so the first
+# dive of a re-solve goes back to the last schedule where it still can
+class Previous_start_first(Ordered_bisection):
+    def __init__(self, csp: CSP, starts: dict):
+        super().__init__(csp)
+        self.starts = starts
+
+    def split(self, var, dom):
+        start = self.starts.get(var)
+        if start is not None and (start, start + dom.duration) in dom:
+            if isinstance(dom, SlotDomain):
+                return (dom.with_mask(1 << start),
+                        dom.with_mask(dom.mask & ~(1 << start)))
+            return (restrict_domain(dom, lambda v: v[0] == start),
+                    restrict_domain(dom, lambda v: v[0] != start))
+        return super().split(var, dom)
+
+
+# a schedule kept across edits, e.g. by an interactive planner
+# edits are lines of a task file given to add or remove
+# adding a domain clause or a constraint only tightens the problem,
+# so only the arcs it touches are revised, from the arc consistent
+# domains of the last solve; a removal restores the compiled domains
+# of the tasks connected to the change and revises their arcs only
+# solve searches from the last schedule and its cost, and keeps the
+# last schedule without searching when it is known to be optimal still
+class Schedule_session:
+    def __init__(self, calendar: Calendar = default_calendar,
+                 **search_options):
+        self.calendar = calendar
+        self.search_options = search_options
+        self.relations = relations(calendar)
+        self.tasks = {}          # as read by read_task
+        self.resources = {}      # resource: the tasks using it
+        self.resource_constraints = {}
+        self.patterns = []       # (kind, tasks, constraint) of each line
+        self.base_domains = {}   # compiled domains of the tasks
+        self.csp = MyCSP({}, [], {}, calendar)
+        self.solver = Con_solver(self.csp)
+        self.domains = {}        # arc consistent domains
+        self.to_do = set()       # arcs to revise at the next solve
+        self.reset = set()       # tasks whose compiled domains come back
+        self.schedule = None     # task: start slot of the last schedule
+        self.cost = None
+        self.optimal = False     # the last schedule is optimal still
+
+    @classmethod
+    def from_file(cls, task_file, calendar: Calendar = default_calendar,
+                  **search_options):
+        session = cls(calendar, **search_options)
+        durations, clauses, constraint_records, resources, pattern_records = \
+            read_records(task_file)
+        for name, duration in durations.items():
+            session.add_task(name, duration)
+        for name, task_clauses in clauses.items():
+            for clause in task_clauses:
+                session.add_clause(name, clause)
+        for record in constraint_records:
+            session.add_constraint(*record)
+        for name, users in resources.items():
+            session.add_resource(name, users)
+        for kind, users in pattern_records:
+            session.add_pattern(kind, users)
+        return session
+
+    # apply one line of a task file
+    def add(self, line: str):
+        record = tokenize_line(line)
+        if record is not None:
+            keyword, fields = record
+            if keyword == 'task':
+                self.add_task(fields[0], int(fields[1]))
+            elif keyword == 'domain':
+                self.add_clause(fields[0], ' '.join(fields[1:]))
+            elif keyword == 'constraint':
+                self.add_constraint(*fields[:3])
+            elif keyword == 'resource':
+                self.add_resource(fields[0], fields[1:])
+            elif keyword == 'pattern':
+                self.add_pattern(fields[0], fields[1:])
+
+    # undo one line of a task file
+    def remove(self, line: str):
+        record = tokenize_line(line)
+        if record is not None:
+            keyword, fields = record
+            if keyword == 'task':
+                self.remove_task(fields[0])
+            elif keyword == 'domain':
+                self.remove_clause(fields[0], ' '.join(fields[1:]))
+            elif keyword == 'constraint':
+                self.remove_constraint(*fields[:3])
+            elif keyword == 'resource':
+                self.remove_resource(fields[0], fields[1:])
+            elif keyword == 'pattern':
+                self.remove_pattern(fields[0], fields[1:])
+
+    def add_task(self, name: str, duration: int):
+        self.tasks[name] = {'duration': duration, 'meta-info': (),
+                            'cost': 0, 'deadline': 0}
+        self.compile(name)
+        self.csp.add_variable(name, self.base_domains[name])
+        self.domains[name] = self.base_domains[name]
+        self.optimal = False
+
+    def remove_task(self, name: str):
+        neighbors = self.csp.connected([name]) - {name}
+        for resource, users in list(self.resources.items()):
+            if name in users:
+                self.set_resource(resource, [u for u in users if u != name])
+        # a pattern does not hold without one of its tasks
+        self.patterns = [p for p in self.patterns if name not in p[1]]
+        self.csp.remove_variable(name)
+        for d in (self.tasks, self.base_domains, self.domains,
+                  self.csp.costs, self.csp.deadlines):
+            del d[name]
+        self.reset |= neighbors
+        self.reset.discard(name)
+        self.to_do = {(v, c) for v, c in self.to_do if name not in c.scope}
+        self.optimal = False
+
+    def add_clause(self, name: str, clause: str):
+        task = self.tasks[name]
+        task['meta-info'] += (clause,)
+        mask, cost, _ = compile_domain(clause, task['duration'],
+                                       self.calendar)
+        self.compile(name)
+        if cost != 0:
+            self.optimal = False    # the costs changed
+        elif name not in self.reset:
+            self.domains[name] = self.domains[name].with_mask(
+                self.domains[name].mask & mask)
+            self.to_do |= self.arcs_from(name)
+
+    def remove_clause(self, name: str, clause: str):
+        task = self.tasks[name]
+        clauses = list(task['meta-info'])
+        clauses.remove(clause)
+        task['meta-info'] = tuple(clauses)
+        self.compile(name)
+        self.reset.add(name)
+        self.optimal = False
+
+    def add_constraint(self, t1: str, relation: str, t2: str):
+        condition, propagator = self.relations.get(
+            relation, self.relations['starts-at'])
+        const = Constraint((t1, t2), condition, propagator)
+        self.csp.add_constraint(const)
+        self.to_do |= {(t1, const), (t2, const)}
+
+    def remove_constraint(self, t1: str, relation: str, t2: str):
+        condition, _ = self.relations.get(
+            relation, self.relations['starts-at'])
+        for const in self.csp.var_to_const[t1]:
+            if const.scope == (t1, t2) and const.condition == condition:
+                self.csp.remove_constraint(const)
+                self.to_do.discard((t1, const))
+                self.to_do.discard((t2, const))
+                self.reset |= {t1, t2}
+                self.optimal = False
+                return
+
+    # a resource with more users only tightens the problem
+    def add_resource(self, resource: str, users: list):
+        self.set_resource(resource, self.resources.get(resource, []) + users)
+
+    def remove_resource(self, resource: str, users: list):
+        old = self.resource_constraints.get(resource)
+        remaining = list(self.resources.get(resource, []))
+        for name in users:
+            if name in remaining:
+                remaining.remove(name)
+        self.set_resource(resource, remaining)
+        if old is not None:
+            self.reset |= set(old.scope)
+            self.optimal = False
+
+    # replace the constraint of a resource by one over users
+    def set_resource(self, resource: str, users: list):
+        old = self.resource_constraints.pop(resource, None)
+        if old is not None:
+            self.csp.remove_constraint(old)
+            self.to_do = {(v, c) for v, c in self.to_do if c is not old}
+        self.resources[resource] = users
+        if len(set(users)) > 1:
+            const = Unary_resource(resource).constraint(users)
+            self.csp.add_constraint(const)
+            self.resource_constraints[resource] = const
+            self.to_do |= {(v, const) for v in const.scope}
+
+    def add_pattern(self, kind: str, users: list):
+        const = pattern_constraint(
+            kind, users, {t: self.tasks[t]['duration'] for t in users},
+            self.calendar)
+        self.patterns.append((kind, list(users), const))
+        self.csp.add_constraint(const)
+        self.to_do |= {(v, const) for v in const.scope}
+
+    def remove_pattern(self, kind: str, users: list):
+        for i, (other_kind, other_users, const) in enumerate(self.patterns):
+            if (other_kind, other_users) == (kind, list(users)):
+                del self.patterns[i]
+                self.csp.remove_constraint(const)
+                self.to_do = {(v, c) for v, c in self.to_do if c is not const}
+                self.reset |= set(const.scope)
+                self.optimal = False
+                return
+
+    # compile the domain, cost and deadline of a task from its clauses
+    def compile(self, name: str):
+        task = self.tasks[name]
+        mask = compile_duration(task['duration'], self.calendar)
+        task['cost'], task['deadline'] = 0, 0
+        for clause in task['meta-info']:
+            clause_mask, cost, deadline = compile_domain(
+                clause, task['duration'], self.calendar)
+            mask &= clause_mask
+            if cost != 0:
+                task['cost'], task['deadline'] = cost, deadline
+        self.base_domains[name] = SlotDomain(task['duration'], mask)
+        self.csp.domains[name] = self.base_domains[name]
+        self.csp.costs[name] = task['cost']
+        self.csp.deadlines[name] = task['deadline']
+
+    # the arcs to revise when the domain of a task shrinks
+    def arcs_from(self, name: str):
+        return {(other, const) for const in self.csp.var_to_const[name]
+                for other in const.scope if other != name}
+
+    # make the domains arc consistent again after the edits
+    def propagate(self):
+        if self.reset:
+            reset = self.csp.connected(self.reset)
+            for name in reset:
+                self.domains[name] = self.base_domains[name]
+                self.to_do |= {(v, c) for c in self.csp.var_to_const[name]
+                               for v in c.scope}
+        self.solver.make_arc_consistent(self.domains, self.to_do,
+                                        in_place=True)
+        self.to_do, self.reset = set(), set()
+        if any(len(d) == 0 for d in self.domains.values()):
+            # arcs left when a domain was wiped out are revised next time
+            self.reset = set(self.domains)
+
+    # the last schedule if it is still a schedule, or None
+    def last_schedule(self):
+        if self.schedule is None or set(self.schedule) != set(self.tasks):
+            return None
+        values = {k: (v, v + self.tasks[k]['duration'])
+                  for k, v in self.schedule.items()}
+        if all(values[k] in self.domains[k] for k in values) and \
+                self.csp.consistent(values):
+            return values
+        return None
+
+    # re-solve after the edits, returns the output lines
+    def solve(self):
+        self.propagate()
+        if any(len(d) == 0 for d in self.domains.values()):
+            self.schedule, self.cost, self.optimal = None, None, False
+            return ['No solution']
+        last = self.last_schedule()
+        if last is None:
+            self.optimal = False
+        elif not self.optimal:
+            self.cost = compute_total_cost(
+                {k: v[1] for k, v in last.items()}, self.csp.deadlines,
+                self.csp.costs, self.calendar)
+        if not self.optimal:
+            problem = Search_with_AC_from_Cost_CSP(
+                self.csp, domains=self.domains, **self.search_options)
+            problem.cons.splitter = Previous_start_first(
+                self.csp, self.schedule or {})
+            searcher = Anytime_branch_and_bound(
+                problem, bound=float('inf') if last is None else self.cost)
+            searcher.max_display_level = 0
+            path = searcher.search()
+            if path is not None:
+                self.schedule = {k: select(v)[0]
+                                 for k, v in path.end().items()}
+                self.cost = searcher.bound
+            elif last is None:
+                self.schedule, self.cost = None, None
+                return ['No solution']
+            self.optimal = True
+        return schedule_lines(self.schedule, self.tasks, self.calendar)
+
+
+''' self checks '''
+
+
+# edits checked by test_session, as ('add' or 'remove', line)
+session_edits = (
+    ('remove', 'domain, t1 tue'),
+    ('add', 'constraint, t2 same-day t7'),
+    ('add', 'domain, t6 ends-by mon 5pm 10'),
+    ('add', 'constraint, t1 before t2'),        # no schedule is left
+    ('remove', 'constraint, t1 before t2'),
+    ('remove', 'domain, t6 ends-by mon 5pm 10'),
+    ('add', 'domain, t4 ends-before wed 12pm'),
+    ('remove', 'domain, t5 ends-by thu 4pm 20'),
+    ('add', 'task, t9 2'),
+    ('add', 'domain, t9 ends-by mon 10am 7'),
+    ('add', 'constraint, t9 after t6'),
+    ('remove', 'domain, t9 ends-by mon 10am 7'),
+    ('remove', 'constraint, t9 after t6'),
+    ('remove', 'task, t9 2'),
+    ('add', 'domain, t1 tue'),
+)
+
+
+# a Schedule_session given a sequence of edits must find schedules
+# as cheap as solving the edited task file afresh after each edit
+def test_session(task_file='input1.txt', edits=session_edits,
+                 calendar: Calendar = default_calendar):
+    print("Testing Schedule_session on", task_file)
+    with open(task_file) as f:
+        lines = [line.strip() for line in f]
+    session = Schedule_session.from_file(task_file, calendar)
+    for edit in ((None, None),) + tuple(edits):
+        action, line = edit
+        if action == 'add':
+            session.add(line)
+            lines.append(line)
+        elif action == 'remove':
+            session.remove(line)
+            lines.remove(line)
+        expected = solve_schedule(io.StringIO('\n'.join(lines)), calendar)
+        found = session.solve()
+        print("After", edit, "found", found[-1])
+        assert found[-1] == expected[-1], \
+            "{} after {}, {} afresh".format(found[-1], edit, expected[-1])
+        if session.schedule is not None:
+            values = {k: (v, v + session.tasks[k]['duration'])
+                      for k, v in session.schedule.items()}
+            assert all(values[k] in session.base_domains[k] for k in values)
+            assert session.csp.consistent(values), edit
+    print("Passed unit test")
+
+
+# no_overlap_masks on random small cases must keep every start of a
+# placement of the tasks without overlap, and fail only if none exists
+def test_no_overlap_masks(cases: int = 2000, seed: int = 0):
+    print("Testing no_overlap_masks on", cases, "random cases")
+    rng = random.Random(seed)
+    for _ in range(cases):
+        slots = rng.randint(1, 11)
+        durations = [rng.randint(1, 4) for _ in range(rng.randint(1, 5))]
+        masks = [rng.randrange(1, 1 << slots) for _ in durations]
+        supported = [0] * len(masks)
+        for starts in product(*[[s for s in range(slots) if m >> s & 1]
+                                for m in masks]):
+            if no_overlap(*[(s, s + d) for s, d in zip(starts, durations)]):
+                for i, s in enumerate(starts):
+                    supported[i] |= 1 << s
+        revised = no_overlap_masks(masks, durations)
+        case = (masks, durations, revised)
+        if all(supported):
+            assert revised is not None, case
+            assert all(s & ~r == 0 and r & ~m == 0 for s, r, m
+                       in zip(supported, revised, masks)), case
+        elif all(m & (m - 1) == 0 for m in masks):
+            # the starts are fixed and overlap
+            assert revised is None, case
+    print("Passed unit test")
+
+
+# a task file with resource lines must give the expected output
+def test_resources(task_file='input5.txt', output_file='output5.txt',
+                   calendar: Calendar = default_calendar):
+    print("Testing resources on", task_file)
+    with open(output_file) as f:
+        expected = f.read().splitlines()
+    for search in ('astar', 'bnb'):
+        found = solve_schedule(task_file, calendar, search=search)
+        assert found[-1] == expected[-1], (search, found[-1])
+    tasks, constraints, domains = read_task(task_file, calendar)
+    starts = {k: calendar.reversed_timeslot[v]
+              for k, v in (line.split(':') for line in found[:-1])}
+    values = {k: (v, v + tasks[k]['duration']) for k, v in starts.items()}
+    assert all(c.holds(values) for c in constraints)
+    print("Passed unit test")
 
 
 if __name__ == '__main__':
-    task_files = sys.argv[1:]
-    for i in task_files:
-        get_one_schedule(i)
+    parser = argparse.ArgumentParser(
+        description='schedule tasks with soft deadlines')
+    parser.add_argument('task_files', nargs='*')
+    parser.add_argument('--days', default='mon,tue,wed,thu,fri',
+                        help='working days, e.g. mon,tue,wed,thu,fri')
+    parser.add_argument('--hours', default='9am-5pm',
+                        help='working hours, e.g. 9am-5pm')
+    parser.add_argument('--weeks', type=int, default=1,
+                        help='number of weeks in the horizon')
+    parser.add_argument('--batch', action='store_true',
+                        help='solve the files (or directories) in parallel')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='number of worker processes in batch '
+                             'or portfolio mode, or for parallel search')
+    parser.add_argument('--portfolio', action='store_true',
+                        help='race several search configurations on '
+                             'each file, one process each, '
+                             'within --time-limit')
+    parser.add_argument('--out-dir', default=None,
+                        help='write each result to an output file '
+                             'in this directory in batch mode')
+    parser.add_argument('--pattern', default='input*.txt',
+                        help='task files to take from a directory')
+    parser.add_argument('--engine', choices=engines, default='python',
+                        help='arc revision engine, numpy needs numpy')
+    parser.add_argument('--persistent', action='store_true',
+                        help='share unchanged domains between search nodes, '
+                             'trading some speed for memory')
+    parser.add_argument('--ordering', choices=sorted(orderings),
+                        default='first',
+                        help='variable to split first: the first one, '
+                             'smallest domain, most constraints, dom/wdeg '
+                             'or largest possible deadline penalty')
+    parser.add_argument('--split', choices=sorted(splitters),
+                        default='bisect',
+                        help='how to split a domain: earlier half first, '
+                             'starts meeting the deadline first, '
+                             'or one start at a time')
+    parser.add_argument('--stn', action='store_true',
+                        help='propagate before, after and starts-at as a '
+                             'simple temporal network before arc consistency')
+    parser.add_argument('--contract', action='store_true',
+                        help='search the tasks linked by starts-at as one '
+                             'block with a single start')
+    parser.add_argument('--decompose', action='store_true',
+                        help='schedule separately the groups of tasks that '
+                             'no constraints link, over --jobs processes')
+    parser.add_argument('--search', choices=searchers, default='astar',
+                        help='A*, or depth-first branch and bound, '
+                             'iterative deepening A* or memory-bounded A*, '
+                             'which need less memory, or branch and bound '
+                             'over --jobs processes')
+    parser.add_argument('--prune', action='store_true',
+                        help='search nodes with the same domains only once '
+                             'with A*')
+    parser.add_argument('--memory-budget', type=float, default=None,
+                        help='megabytes the pruning table or the '
+                             'memory-bounded A* frontier may use, '
+                             'unlimited by default')
+    parser.add_argument('--max-nodes', type=int, default=None,
+                        help='open nodes the memory-bounded A* may keep')
+    parser.add_argument('--time-limit', type=float, default=None,
+                        help='seconds to search; the best schedule found '
+                             'is printed with a lower bound on the cost')
+    parser.add_argument('--max-expanded', type=int, default=None,
+                        help='nodes to expand, as for --time-limit')
+    parser.add_argument('--test', action='store_true',
+                        help='run the self checks on the example inputs')
+    args = parser.parse_args()
+    if args.test:
+        test_session()
+        test_no_overlap_masks()
+        test_resources()
+        sys.exit(0)
+    search_options = {'persistent': args.persistent, 'stn': args.stn,
+                      'ordering': args.ordering, 'split': args.split,
+                      'decompose': args.decompose,
+                      'contract': args.contract,
+                      'search': args.search, 'prune': args.prune,
+                      'max_nodes': args.max_nodes,
+                      'time_limit': args.time_limit,
+                      'max_expanded': args.max_expanded,
+                      'workers': args.jobs}
+    if args.memory_budget is not None:
+        search_options['memory_budget'] = int(args.memory_budget * 2 ** 20)
+
+    if args.engine == 'numpy':
+        try:
+            import numpy
+        except ImportError:
+            parser.error('the numpy engine needs numpy to be installed')
+
+    if args.batch and args.search == 'parallel':
+        parser.error('--batch already spreads the files over --jobs '
+                     'processes, use another --search')
+    if args.portfolio and (args.max_expanded is not None or args.decompose):
+        parser.error('--portfolio takes a --time-limit only, '
+                     'not --max-expanded or --decompose')
+
+    calendar = parse_calendar(args.days, args.hours, args.weeks)
+    if args.batch:
+        task_files = collect_task_files(args.task_files, args.pattern)
+        # the files are spread over --jobs processes already,
+        # so each of them solves its file, and its groups, in one process
+        search_options['workers'] = None
+        try:
+            failures = solve_batch(task_files, calendar, args.jobs,
+                                   args.out_dir, args.engine,
+                                   **search_options)
+        except ValueError as e:
+            parser.error(str(e))
+        sys.exit(1 if failures else 0)
+    for i in args.task_files:
+        if args.portfolio:
+            print('\n'.join(solve_portfolio(
+                i, calendar, args.engine, args.jobs,
+                time_limit=args.time_limit, contract=args.contract,
+                stn=args.stn, persistent=args.persistent)))
+        else:
+            get_one_schedule(i, calendar, args.engine, **search_options)
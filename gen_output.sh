@@ -1,11 +1,5 @@
 #!/bin/bash
 
-txt_files=`ls`
-for i in $txt_files
-do
-    if [[ "$i" =~ "input".*"txt" ]]
-    then
-        printf "$i...\n"
-        python3 fuzzyScheduler.py $i > ${i/input/output}
-    fi
-done
\ No newline at end of file
+# solve every input*.txt here in parallel and write
+# the result of inputN.txt into outputN.txt
+python3 fuzzyScheduler.py --batch --out-dir . .
\ No newline at end of file
@@ -0,0 +1,180 @@
+import numpy as np
+from cspProblem import Domain
+
+
+'''
+vectorized arc revision for the scheduler
+
+a domain is a boolean array over the slots of the
+calendar, where True at index s stands for the value
+(s, s + duration). a whole arc of before, after,
+starts-at or same-day is revised with a few array
+operations, using cumulative or-masks in place of the
+earliest and latest starts of the other task
+'''
+
+
+# domain of a task kept as a boolean array of possible start slots
+class ArrayDomain(Domain):
+    __slots__ = ('duration', 'array')
+
+    def __init__(self, duration: int, array):
+        self.duration = duration
+        self.array = array
+
+    # the domain standing for the same values as a slot mask
+    @classmethod
+    def from_mask(cls, duration: int, mask: int, size: int):
+        array = np.zeros(size, dtype=bool)
+        array[[s for s in range(size) if (mask >> s) & 1]] = True
+        return cls(duration, array)
+
+    def with_array(self, array):
+        return ArrayDomain(self.duration, array)
+
+    # values are generated in chronological order
+    def __iter__(self):
+        for s in np.flatnonzero(self.array):
+            yield (int(s), int(s) + self.duration)
+
+    def __len__(self):
+        return int(np.count_nonzero(self.array))
+
+    def __bool__(self):
+        return bool(self.array.any())
+
+    def __contains__(self, value):
+        return (0 <= value[0] < len(self.array)
+                and value[1] == value[0] + self.duration
+                and bool(self.array[value[0]]))
+
+    def __eq__(self, other):
+        if isinstance(other, ArrayDomain):
+            return (self.duration == other.duration
+                    and np.array_equal(self.array, other.array))
+        return Domain.__eq__(self, other)
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    # the packed starts, equal for equal domains of a task
+    def key(self):
+        return np.packbits(self.array).tobytes()
+
+    def __repr__(self):
+        return repr(set(self))
+
+    def filter(self, test):
+        array = np.zeros_like(self.array)
+        for value in self:
+            if test(value):
+                array[value[0]] = True
+        return self.with_array(array)
+
+    # the earlier half of the starts and the rest
+    def split(self):
+        starts = np.flatnonzero(self.array)
+        first = np.zeros_like(self.array)
+        first[starts[:len(starts) // 2]] = True
+        return self.with_array(first), self.with_array(self.array & ~first)
+
+    # the earliest start and the rest
+    def split_first(self):
+        first = np.zeros_like(self.array)
+        first[np.argmax(self.array)] = True
+        return self.with_array(first), self.with_array(self.array & ~first)
+
+
+# convert the slot domains given by read_task
+def array_domains(domains: dict, size: int):
+    return {k: ArrayDomain.from_mask(d.duration, d.mask, size)
+            for k, d in domains.items()}
+
+
+''' array operations '''
+
+
+# result[i] is array[i + k], False out of range
+def shift(array, k: int):
+    if k == 0:
+        return array
+    result = np.zeros_like(array)
+    if 0 < k < len(array):
+        result[:-k] = array[k:]
+    elif -len(array) < k < 0:
+        result[-k:] = array[:k]
+    return result
+
+
+# result[i] is True if some array[j] is True for j <= i
+def prefix_any(array):
+    return np.logical_or.accumulate(array)
+
+
+# result[i] is True if some array[j] is True for j >= i
+def suffix_any(array):
+    return np.logical_or.accumulate(array[::-1])[::-1]
+
+
+''' vectorized propagators, see fuzzyScheduler.propagate_before '''
+
+
+# the two array domains of a binary constraint, or None
+def array_pair(const, domains: dict):
+    x, y = (domains[v] for v in const.scope)
+    if (isinstance(x, ArrayDomain) and isinstance(y, ArrayDomain)
+            and const.scope[0] != const.scope[1]):
+        return x, y
+    return None, None
+
+
+# t1 must end by some start of t2
+def numpy_before(const, var, domains: dict):
+    x, y = array_pair(const, domains)
+    if x is None:
+        return None
+    if var == const.scope[0]:
+        return x.with_array(x.array & shift(suffix_any(y.array), x.duration))
+    return y.with_array(y.array & shift(prefix_any(x.array), -x.duration))
+
+
+# t1 must start after some end of t2
+def numpy_after(const, var, domains: dict):
+    x, y = array_pair(const, domains)
+    if x is None:
+        return None
+    if var == const.scope[0]:
+        return x.with_array(x.array & shift(prefix_any(y.array), -y.duration))
+    return y.with_array(y.array & shift(suffix_any(x.array), y.duration))
+
+
+# t1 starts exactly at t2 + duration of t2
+def numpy_start_at(const, var, domains: dict):
+    x, y = array_pair(const, domains)
+    if x is None:
+        return None
+    if var == const.scope[0]:
+        return x.with_array(x.array & shift(y.array, -y.duration))
+    return y.with_array(y.array & shift(x.array, y.duration))
+
+
+# propagators of every constraint type for the given calendar
+# same-day looks the days of the other task up by slot
+def numpy_propagators(calendar):
+    day_of = np.array(calendar.day_of)
+    num_days = len(calendar.week_dict)
+
+    def numpy_same_day(const, var, domains: dict):
+        x, y = array_pair(const, domains)
+        if x is None:
+            return None
+        other = y if var == const.scope[0] else x
+        days = np.zeros(num_days, dtype=bool)
+        days[day_of[other.array]] = True
+        return domains[var].with_array(domains[var].array & days[day_of])
+
+    return {'before': numpy_before, 'after': numpy_after,
+            'same-day': numpy_same_day, 'starts-at': numpy_start_at}
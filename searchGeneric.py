@@ -58,6 +58,13 @@ class Searcher(Displayable):
                      self.num_expanded,"paths expanded.")
 
 import heapq        # part of the Python standard library
+import multiprocessing
+import pickle
+import queue
+import sys
+import time
+from collections import OrderedDict, deque
+from collections.abc import Mapping
 from searchProblem import Path
 
 class FrontierPQ(object):
@@ -127,6 +134,587 @@ class AStarSearcher(Searcher):
         value = path.cost+self.problem.heuristic(path.end())
         self.frontier.add(path, value)
 
+class Transposition_table(object):
+    """A table of the lowest cost found for each node reached, keyed on the
+    fingerprint of the node given by the search problem.
+    * memory_budget is the approximate number of bytes the table may use,
+      or None for no limit. When the table is over budget, the entries
+      that were updated least recently are evicted. Evicting only loses
+      pruning: an evicted node may be searched again.
+    """
+    entry_overhead = 100   # approximate bytes of a table entry, besides its key
+
+    def __init__(self, memory_budget=None):
+        self.memory_budget = memory_budget
+        self.costs = OrderedDict()   # fingerprint: lowest cost of a path to it
+        self.sizes = {}              # fingerprint: approximate bytes of its entry
+        self.num_bytes = 0
+        self.num_evicted = 0
+
+    def __len__(self):
+        return len(self.costs)
+
+    def get(self, key):
+        """returns the lowest cost recorded for key, or None"""
+        return self.costs.get(key)
+
+    def record(self, key, cost):
+        """records that a path of the given cost reaches the node with key"""
+        if key in self.costs:
+            self.costs.move_to_end(key)
+        else:
+            size = self.entry_size(key)
+            self.sizes[key] = size
+            self.num_bytes += size
+        self.costs[key] = cost
+        if self.memory_budget is not None:
+            while self.num_bytes > self.memory_budget and len(self.costs) > 1:
+                old, _ = self.costs.popitem(last=False)
+                self.num_bytes -= self.sizes.pop(old)
+                self.num_evicted += 1
+
+    def entry_size(self, key):
+        """approximate bytes used by the entry for key"""
+        size = sys.getsizeof(key) + self.entry_overhead
+        if isinstance(key, tuple):
+            size += sum(sys.getsizeof(k) for k in key)
+        return size
+
+class AStarSearcherMPP(AStarSearcher):
+    """returns an A* searcher with multiple-path pruning.
+    A path is not added to the frontier when a path at most as costly
+    reaches the same node (closed set and frontier deduplication),
+    and a path popped from the frontier is not expanded when a
+    cheaper path to its node has been found since it was added.
+    Nodes are the same when the problem gives them the same fingerprint.
+    memory_budget bounds the size of the table, see Transposition_table.
+    """
+
+    def __init__(self, problem, memory_budget=None):
+        self.table = Transposition_table(memory_budget)
+        self.num_pruned = 0
+        super().__init__(problem)
+
+    def add_to_frontier(self,path):
+        """add path to the frontier unless its node is reached as cheaply"""
+        key = self.problem.fingerprint(path.end())
+        best = self.table.get(key)
+        if best is not None and best <= path.cost:
+            self.num_pruned += 1
+        else:
+            self.table.record(key, path.cost)
+            super().add_to_frontier(path)
+
+    @visualize
+    def search(self):
+        """returns (next) path from the problem's start node
+        to a goal node. 
+        Returns None if no path exists.
+        """
+        while not self.empty_frontier():
+            path = self.frontier.pop()
+            best = self.table.get(self.problem.fingerprint(path.end()))
+            if best is not None and best < path.cost:
+                self.num_pruned += 1     # a cheaper path was found since
+                continue
+            self.display(2, "Expanding:",path,"(cost:",path.cost,")")
+            self.num_expanded += 1
+            if self.problem.is_goal(path.end()):    # solution found
+                self.display(1, self.num_expanded, "paths have been expanded,",
+                             self.num_pruned, "pruned and",
+                             len(self.frontier), "paths remain in the frontier")
+                self.solution = path   # store the solution found
+                return path
+            else:
+                neighs = self.problem.neighbors(path.end())
+                self.display(3,"Neighbors are", neighs)
+                for arc in reversed(list(neighs)):
+                    self.add_to_frontier(Path(path,arc))
+                self.display(3,"Frontier:",self.frontier)
+        self.display(1,"No (more) solutions. Total of",
+                     self.num_expanded,"paths expanded and",
+                     self.num_pruned,"pruned.")
+
+class DF_branch_and_bound(Searcher):
+    """returns a depth-first branch-and-bound searcher for a problem.
+    It keeps the best path found (the incumbent) and its cost, and prunes
+    any path whose cost plus heuristic reaches that cost, so it needs an
+    admissible heuristic to return an optimal path. The frontier is a
+    stack, so memory is linear in the depth of the search.
+    The cost of a goal is its path cost plus its heuristic value, which
+    lets a problem give the remaining cost of a goal node (usually 0).
+    """
+    def __init__(self, problem, bound=float("inf")):
+        """creates a searcher that finds a path cheaper than bound
+        """
+        super().__init__(problem)
+        self.best_path = None
+        self.bound = bound
+
+    @visualize
+    def search(self):
+        """returns an optimal path from the problem's start node
+        to a goal node, or None if there is no path cheaper than the bound.
+        """
+        self.frontier = [Path(self.problem.start_node())]
+        self.num_expanded = 0
+        self.num_pruned = 0
+        while self.frontier:
+            path = self.frontier.pop()
+            value = path.cost+self.problem.heuristic(path.end())
+            if value < self.bound:
+                self.display(3,"Expanding:",path,"cost:",path.cost)
+                self.num_expanded += 1
+                if self.problem.is_goal(path.end()):
+                    self.best_path = path
+                    self.bound = value
+                    self.display(2,"New best path:",path," cost:",value)
+                else:
+                    neighs = self.problem.neighbors(path.end())
+                    for arc in reversed(list(neighs)):
+                        self.add_to_frontier(Path(path, arc))
+            else:
+                self.num_pruned += 1
+        self.display(1,"Number of paths expanded:",self.num_expanded,
+                     "pruned:",self.num_pruned)
+        self.solution = self.best_path
+        return self.best_path
+
+class Anytime_branch_and_bound(DF_branch_and_bound):
+    """returns an anytime depth-first branch-and-bound searcher for a problem.
+    The neighbors of a path are searched in order of cost plus heuristic,
+    so the first dive is greedy and finds a goal quickly. Each better goal
+    found is passed to report(path, cost), if given.
+    The search stops when time_limit seconds have passed or max_expanded
+    paths have been expanded. It then returns the best path found,
+    and lower_bound is the lowest cost a path may still have
+    (the cost of the best path when optimal is True).
+    """
+    def __init__(self, problem, bound=float("inf"), time_limit=None,
+                 max_expanded=None, report=None):
+        super().__init__(problem, bound)
+        self.time_limit = time_limit
+        self.max_expanded = max_expanded
+        self.report = report
+        self.lower_bound = None
+        self.optimal = False
+
+    def out_of_budget(self, start_time):
+        return ((self.max_expanded is not None
+                 and self.num_expanded >= self.max_expanded)
+                or (self.time_limit is not None
+                    and time.perf_counter() - start_time >= self.time_limit))
+
+    @visualize
+    def search(self):
+        """returns the best path from the problem's start node to a goal node
+        found within the budget, or None if none was found.
+        """
+        start_time = time.perf_counter()
+        self.frontier = [Path(self.problem.start_node())]
+        self.num_expanded = 0
+        self.num_pruned = 0
+        while self.frontier and not self.out_of_budget(start_time):
+            path = self.frontier.pop()
+            value = path.cost+self.problem.heuristic(path.end())
+            if value < self.bound:
+                self.display(3,"Expanding:",path,"cost:",path.cost)
+                self.num_expanded += 1
+                if self.problem.is_goal(path.end()):
+                    self.best_path = path
+                    self.bound = value
+                    self.display(2,"New best path:",path," cost:",value)
+                    if self.report:
+                        self.report(path, value)
+                else:
+                    neighs = [Path(path, arc) for arc in self.problem.neighbors(path.end())]
+                    neighs.sort(key=lambda p: p.cost+self.problem.heuristic(p.end()),
+                                reverse=True)    # the best one is popped first
+                    self.frontier.extend(neighs)
+            else:
+                self.num_pruned += 1
+        self.optimal = not self.frontier
+        self.lower_bound = min([self.bound] +
+                               [p.cost+self.problem.heuristic(p.end()) for p in self.frontier])
+        self.display(1,"Number of paths expanded:",self.num_expanded,
+                     "pruned:",self.num_pruned,"lower bound:",self.lower_bound)
+        self.solution = self.best_path
+        return self.best_path
+
+def parallel_worker(problem, work, hungry, pending, best_cost, results):
+    """depth-first branch and bound in one process of Parallel_branch_and_bound.
+    It takes subtrees, as (node, cost) pairs, from work. While other workers
+    are hungry, it hands them the shallowest open node of its own stack.
+    pending counts the subtrees in work or being searched: the search is
+    over when it reaches 0. Better goals are sent to results as
+    ('goal', value, node), and ('done', number expanded, error) when it
+    stops, where error is the exception raised by the search or None.
+    """
+    stack = deque()     # open (node, cost) pairs of the current subtree
+    num_expanded = 0
+    holding = False     # whether the worker counts for a subtree in pending
+    error = None
+    try:
+        while True:
+            if not stack:
+                with hungry.get_lock():
+                    hungry.value += 1
+                while not stack:
+                    try:
+                        stack.append(work.get(timeout=0.01))
+                        holding = True
+                    except queue.Empty:
+                        if pending.value == 0:
+                            return
+                with hungry.get_lock():
+                    hungry.value -= 1
+            node, cost = stack.pop()
+            value = cost+problem.heuristic(node)
+            if value < best_cost.value:
+                num_expanded += 1
+                if problem.is_goal(node):
+                    with best_cost.get_lock():
+                        if value < best_cost.value:
+                            best_cost.value = value
+                            results.put(('goal', value, node))
+                else:
+                    neighs = [(arc.to_node, cost+arc.cost) for arc in problem.neighbors(node)]
+                    neighs.sort(key=lambda n: n[1]+problem.heuristic(n[0]),
+                                reverse=True)    # the best one is popped first
+                    stack.extend(neighs)
+            if hungry.value > 0 and len(stack) > 1:
+                with pending.get_lock():
+                    pending.value += 1
+                work.put(stack.popleft())
+            if not stack:
+                with pending.get_lock():
+                    pending.value -= 1
+                holding = False
+    except Exception as e:
+        error = e
+        try:
+            pickle.dumps(error)
+        except Exception:
+            error = RuntimeError(repr(e))
+        if holding:     # the rest of the subtree is given up
+            with pending.get_lock():
+                pending.value -= 1
+    finally:
+        results.put(('done', num_expanded, error))
+
+class Parallel_branch_and_bound(Displayable):
+    """returns a parallel depth-first branch-and-bound searcher for a problem.
+    jobs processes (by default one per core) search subtrees depth first,
+    idle processes get open nodes from busy ones (work stealing), and
+    they share the cost of the best goal found for pruning.
+    As for DF_branch_and_bound, the cost of a goal includes its heuristic
+    value, and it needs an admissible heuristic to be optimal.
+    The problem is given to the processes: it is copied when they are
+    forked, and must be picklable where processes are spawned.
+    Subtrees are handed out as nodes, so the path returned is the goal
+    node alone; best_cost is its cost.
+    """
+    def __init__(self, problem, jobs=None, bound=float("inf")):
+        self.problem = problem
+        self.jobs = jobs or multiprocessing.cpu_count()
+        self.bound = bound
+        self.best_cost = None
+        self.num_expanded = 0
+        super().__init__()
+
+    @visualize
+    def search(self):
+        """returns a path made of an optimal goal node,
+        or None if there is no goal cheaper than the bound.
+        """
+        work = multiprocessing.Queue()
+        results = multiprocessing.Queue()
+        hungry = multiprocessing.Value('i', 0)
+        pending = multiprocessing.Value('i', 1)
+        best_cost = multiprocessing.Value('d', self.bound)
+        work.put((self.problem.start_node(), 0))
+        workers = [multiprocessing.Process(
+            target=parallel_worker, daemon=True,
+            args=(self.problem, work, hungry, pending, best_cost, results))
+            for _ in range(self.jobs)]
+        for w in workers:
+            w.start()
+        goal = None
+        running = len(workers)
+        try:
+            while running:
+                try:
+                    message = results.get(timeout=0.1)
+                except queue.Empty:
+                    # a process killed or crashed never sends done
+                    for w in workers:
+                        if w.exitcode not in (None, 0):
+                            raise RuntimeError("search process exited with code "
+                                               + str(w.exitcode))
+                    continue
+                if message[0] == 'goal':
+                    if self.best_cost is None or message[1] < self.best_cost:
+                        self.best_cost, goal = message[1], message[2]
+                        self.display(2,"New best goal, cost:",self.best_cost)
+                else:
+                    running -= 1
+                    self.num_expanded += message[1]
+                    if message[2] is not None:
+                        raise message[2]
+        finally:
+            for w in workers:
+                if running:
+                    w.terminate()
+                w.join()
+        self.display(1,"Number of nodes expanded:",self.num_expanded,
+                     "by",self.jobs,"processes")
+        self.solution = None if goal is None else Path(goal)
+        return self.solution
+
+class IDAStarSearcher(Searcher):
+    """returns an iterative-deepening A* searcher for a problem.
+    Each iteration is a depth-first search of the paths whose cost plus
+    heuristic is at most a bound. The bound starts at the heuristic value
+    of the start node and is raised to the smallest value that exceeded it,
+    so with an admissible heuristic the first goal found is optimal.
+    Memory is linear in the depth. Paths that revisit a node of the
+    current path (with the same fingerprint) are pruned.
+    As for DF_branch_and_bound, the cost of a goal includes its heuristic.
+    """
+    def __init__(self, problem):
+        super().__init__(problem)
+        self.num_iterations = 0
+
+    @visualize
+    def search(self):
+        """returns an optimal path from the problem's start node
+        to a goal node, or None if no path exists.
+        """
+        start = Path(self.problem.start_node())
+        bound = self.problem.heuristic(start.end())
+        self.num_expanded = 0
+        while bound < float("inf"):
+            self.num_iterations += 1
+            self.display(2,"Iteration",self.num_iterations,"with bound",bound)
+            path, bound = self.bounded_search(start, bound)
+            if path is not None:
+                self.display(1, self.num_expanded, "paths have been expanded in",
+                             self.num_iterations, "iterations")
+                self.solution = path
+                return path
+        self.display(1,"No solution. Total of",
+                     self.num_expanded,"paths expanded.")
+
+    def bounded_search(self, start, bound):
+        """depth-first search of the paths with value at most bound.
+        Returns (goal path, None) if a goal is found,
+        otherwise (None, the smallest value that exceeded bound).
+        """
+        next_bound = float("inf")
+        on_path = set()              # fingerprints of the nodes of the current path
+        stack = [(start, None, None)]   # (path, its remaining arcs, its fingerprint)
+        while stack:
+            path, arcs, key = stack[-1]
+            if arcs is None:         # first visit of path
+                stack.pop()
+                value = path.cost+self.problem.heuristic(path.end())
+                if value > bound:
+                    next_bound = min(next_bound, value)
+                    continue
+                key = self.problem.fingerprint(path.end())
+                if key in on_path:   # a cycle
+                    continue
+                self.display(3,"Expanding:",path,"value:",value)
+                self.num_expanded += 1
+                if self.problem.is_goal(path.end()):
+                    return path, None
+                on_path.add(key)
+                arcs = iter(list(self.problem.neighbors(path.end())))
+                stack.append((path, arcs, key))
+            else:
+                arc = next(arcs, None)
+                if arc is None:      # all neighbors of path are done
+                    stack.pop()
+                    on_path.discard(key)
+                else:
+                    stack.append((Path(path, arc), None, None))
+        return None, next_bound
+
+class SMA_entry(object):
+    """A path in the search tree of SMAStarSearcher.
+    * value is the (backed-up) value of the path
+    * parent is the entry of the path it extends, index the position
+      of its arc among the neighbors of the parent, depth its number of arcs
+    * forgotten maps the index of each dropped child to its value
+    * live_children is the number of children that are kept
+    """
+    __slots__ = ('path', 'value', 'parent', 'index', 'depth', 'forgotten',
+                 'live_children', 'in_frontier', 'stamp', 'size')
+
+    def __init__(self, path, value, parent=None, index=None):
+        self.path = path
+        self.value = value
+        self.parent = parent
+        self.index = index
+        self.depth = 0 if parent is None else parent.depth + 1
+        self.forgotten = {}
+        self.live_children = 0
+        self.in_frontier = False
+        self.stamp = 0
+        self.size = 0
+
+class SMAStarSearcher(AStarSearcher):
+    """returns a simplified memory-bounded A* (SMA*) searcher for a problem.
+    It is A* preferring deeper paths for ties, but when the frontier has more than max_nodes paths or
+    (approximately) more than max_bytes bytes of nodes, it drops the
+    frontier paths with the highest value. The parent of a dropped path
+    remembers its value and returns to the frontier, so that the dropped
+    path is generated again if its value becomes the lowest.
+    The budget is exceeded only when no path can be dropped: the best one,
+    the root and the paths with children kept stay in the frontier.
+    With an admissible heuristic it returns an optimal path.
+    The problem's neighbors must give the same arcs in the same order
+    each time they are asked for the same node.
+    As for DF_branch_and_bound, the cost of a goal includes its heuristic.
+    """
+    def __init__(self, problem, max_nodes=None, max_bytes=None):
+        self.max_nodes = max_nodes
+        self.max_bytes = max_bytes
+        self.num_forgotten = 0
+        super().__init__(problem)
+
+    def initialize_frontier(self):
+        self.best = []          # heap of (value, -depth, -stamp, entry)
+        self.worst = []         # heap of (-value, depth, stamp, entry), to drop paths
+        self.num_frontier = 0   # number of entries in the frontier
+        self.num_bytes = 0      # approximate bytes of their nodes
+        self.num_stamps = 0
+
+    def empty_frontier(self):
+        return self.num_frontier == 0
+
+    def add_to_frontier(self,path):
+        """adds path as the root of the search tree"""
+        self.push(SMA_entry(path, path.cost+self.problem.heuristic(path.end())))
+
+    def push(self, entry):
+        """adds entry to the frontier, or updates its value if it is there"""
+        if not entry.in_frontier:
+            entry.in_frontier = True
+            entry.size = self.node_size(entry.path.end()) if self.max_bytes else 0
+            self.num_frontier += 1
+            self.num_bytes += entry.size
+        self.num_stamps += 1
+        entry.stamp = self.num_stamps   # older heap items of entry are stale
+        heapq.heappush(self.best, (entry.value, -entry.depth, -entry.stamp, entry))
+        heapq.heappush(self.worst, (-entry.value, entry.depth, entry.stamp, entry))
+
+    def remove(self, entry):
+        """removes entry from the frontier; its heap items become stale"""
+        entry.in_frontier = False
+        self.num_frontier -= 1
+        self.num_bytes -= entry.size
+
+    def node_size(self, node):
+        """approximate bytes of node, including the values of a mapping"""
+        size = sys.getsizeof(node)
+        if isinstance(node, Mapping):
+            size += sum(sys.getsizeof(val) for val in node.values())
+        return size
+
+    def peek_best(self):
+        """returns the frontier entry with the lowest value, dropping stale items"""
+        while True:
+            (_, _, stamp, entry) = self.best[0]
+            if entry.in_frontier and entry.stamp == -stamp:
+                return entry
+            heapq.heappop(self.best)
+
+    def pop_best(self):
+        """removes and returns the frontier entry with the lowest value"""
+        entry = self.peek_best()
+        heapq.heappop(self.best)
+        self.remove(entry)
+        return entry
+
+    def over_budget(self):
+        return ((self.max_nodes is not None and self.num_frontier > self.max_nodes)
+                or (self.max_bytes is not None and self.num_bytes > self.max_bytes))
+
+    def drop_worst(self):
+        """drops the frontier leaf with the highest value, the shallowest
+        one for ties. The best path, the root and the paths with children
+        kept are not dropped. Returns False if there is none to drop.
+        """
+        kept = []     # entries that cannot be dropped
+        dropped = False
+        best = self.peek_best()
+        while self.worst:
+            item = heapq.heappop(self.worst)
+            (_, _, stamp, entry) = item
+            if not entry.in_frontier or entry.stamp != stamp:
+                continue          # stale
+            if entry is best or entry.live_children > 0 or entry.parent is None:
+                kept.append(item)
+                continue
+            self.remove(entry)
+            self.num_forgotten += 1
+            self.display(3,"Dropping:",entry.path,"value:",entry.value)
+            parent = entry.parent
+            parent.live_children -= 1
+            parent.forgotten[entry.index] = entry.value
+            value = min(parent.forgotten.values())
+            if not parent.in_frontier or value < parent.value:
+                parent.value = value
+                self.push(parent)
+            dropped = True
+            break
+        for item in kept:
+            heapq.heappush(self.worst, item)
+        return dropped
+
+    def remove_dead(self, entry):
+        """entry has no children left to search, so its parent loses a child"""
+        while (entry is not None and entry.live_children == 0
+               and not entry.forgotten and not entry.in_frontier):
+            entry = entry.parent
+            if entry is not None:
+                entry.live_children -= 1
+
+    @visualize
+    def search(self):
+        """returns (next) path from the problem's start node
+        to a goal node. 
+        Returns None if no path exists.
+        """
+        while not self.empty_frontier():
+            entry = self.pop_best()
+            path = entry.path
+            self.display(2, "Expanding:",path,"(value:",entry.value,")")
+            self.num_expanded += 1
+            if self.problem.is_goal(path.end()):    # solution found
+                self.display(1, self.num_expanded, "paths have been expanded,",
+                             self.num_forgotten, "dropped and",
+                             self.num_frontier, "paths remain in the frontier")
+                self.solution = path   # store the solution found
+                return path
+            arcs = list(self.problem.neighbors(path.end()))
+            forgotten = entry.forgotten
+            entry.forgotten = {}
+            for index, arc in enumerate(arcs):
+                if forgotten and index not in forgotten:
+                    continue     # the child is still kept
+                child = Path(path, arc)
+                value = max(entry.value, forgotten.get(index, entry.value),
+                            child.cost+self.problem.heuristic(child.end()))
+                self.push(SMA_entry(child, value, entry, index))
+                entry.live_children += 1
+            self.remove_dead(entry)
+            while self.over_budget() and self.drop_worst():
+                pass
+        self.display(1,"No (more) solutions. Total of",
+                     self.num_expanded,"paths expanded.")
+
 import searchProblem as searchProblem
 
 def test(SearchClass, problem=searchProblem.problem1, solution=['g','d','c','b','a'] ):
@@ -146,6 +734,12 @@ def test(SearchClass, problem=searchProblem.problem1, solution=['g','d','c','b',
 if __name__ == "__main__":
     #test(Searcher)
     test(AStarSearcher)
+    test(AStarSearcherMPP)
+    test(DF_branch_and_bound)
+    test(Anytime_branch_and_bound)
+    test(IDAStarSearcher)
+    test(SMAStarSearcher)
+    test(lambda problem: SMAStarSearcher(problem, max_nodes=2))
     
 # example queries:
 # searcher1 = Searcher(searchProblem.acyclic_delivery_problem)   # DFS
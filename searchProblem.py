@@ -33,6 +33,12 @@ class Search_problem(object):
         Returns 0 if not overridden."""
         return 0
 
+    def fingerprint(self,node):
+        """returns a hashable value that is equal for nodes that are the same.
+        Used for multiple-path pruning. Returns the node if not overridden,
+        so nodes must then be hashable."""
+        return node
+
 class Arc(object):
     """An arc has a from_node and a to_node node and a (non-negative) cost"""
     def __init__(self, from_node, to_node, cost=1, action=None):